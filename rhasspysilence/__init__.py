@@ -1,20 +1,33 @@
 """Voice command recording using webrtcvad."""
+import array
 import audioop
+import itertools
 import logging
-import math
+import mmap
+import tempfile
+import time
 import typing
 from collections import deque
 
 import webrtcvad
 
 from .const import (
+    AudioBuffer,
+    AudioSegment,
+    FrameStats,
+    PhraseOverflowPolicy,
+    RecorderConfig,
     SilenceMethod,
     VoiceCommand,
     VoiceCommandEvent,
     VoiceCommandEventType,
     VoiceCommandRecorder,
     VoiceCommandResult,
+    _byte_view,
 )
+from .endpoint import EndpointStats, UtteranceStats
+from .energy import EnergyTracker, get_energy_tracker
+from .trace import TraceFrameFlags, TraceWriter
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -24,6 +37,16 @@ _LOGGER = logging.getLogger(__name__)
 class WebRtcVadRecorder(VoiceCommandRecorder):
     """Detect speech/silence using webrtcvad.
 
+    Settings are kept in a frozen RecorderConfig, which may be shared by any
+    number of recorders (e.g., one per device). If no config is given, one is
+    created from the keyword arguments. Settings are available as read-only
+    attributes of the recorder.
+
+    Recorder state is kept in __slots__. A webrtcvad detector is created when
+    audio is first analyzed and dropped by stop(), so each voice command starts
+    with a fresh detector. Audio buffers and frame statistics are only
+    allocated once they are needed.
+
     Attributes
     ----------
     vad_mode: int = 3
@@ -63,8 +86,106 @@ class WebRtcVadRecorder(VoiceCommandRecorder):
 
     silence_method: SilenceMethod = "vad_only"
         Method for deciding if an audio chunk contains silence or speech
+
+    keep_frame_stats: bool = False
+        Keep energy and speech/silence decision of each recorded frame
+
+    compute_energy: bool = False
+        Compute energy of every frame (last_energy) and track max energy for
+        get_max_current_ratio, even if the silence method does not need it
+
+    max_events: Optional[int] = None
+        Maximum number of events to keep (oldest are dropped, None for no limit)
+
+    max_phrase_bytes: Optional[int] = None
+        Maximum bytes of voice command audio to keep in memory (None for no limit)
+
+    phrase_overflow: PhraseOverflowPolicy = "truncate"
+        What to do with voice command audio beyond max_phrase_bytes
+
+    reset_max_energy: bool = False
+        Forget dynamic max energy at the start of each voice command
+
+    reset_vad: bool = False
+        Use a new webrtcvad detector for each voice command
+
+    keep_audio: bool = True
+        Keep audio of voice command (False to only report sample offsets)
+
+    max_energy_seconds: Optional[float] = None
+        Seconds of audio over which dynamic max energy is tracked (None for all)
+
+    max_energy_percentile: Optional[float] = None
+        Use this percentile (0-100) of energy instead of max for dynamic setting
+
+    adaptive_vad_frames: Optional[int] = None
+        Run webrtcvad less often after this many identical decisions (None to disable)
+
+    adaptive_vad_max_error: float = 0.12
+        Maximum seconds a speech/silence change may be noticed late (adaptive VAD)
+
+    adaptive_vad_energy_ratio: float = 2.0
+        Change in frame energy that restores full-rate webrtcvad (adaptive VAD)
+
+    adaptive_silence: bool = False
+        Adapt seconds of silence that end a voice command to the speaker
+
+    adaptive_silence_min_seconds: float = 0.2
+        Minimum seconds of silence before a voice command has finished (adaptive)
+
+    adaptive_silence_max_seconds: float = 1.0
+        Maximum seconds of silence before a voice command has finished (adaptive)
+
+    adaptive_silence_pause_factor: float = 1.5
+        Wait this many times the longest pause between words (adaptive)
+
+    adaptive_silence_decay_ratio: float = 10.0
+        Ratio of speech/silence energy below which silence_seconds is waited (adaptive)
+
+    config: Optional[RecorderConfig] = None
+        Shared settings (other keyword arguments are ignored if given)
+
+    trace: Optional[TraceWriter] = None
+        Append settings, input frames, decisions, energies, and timing to a trace
     """
 
+    __slots__ = (
+        "config",
+        "vad",
+        "max_energy",
+        "max_energy_tracker",
+        "_events",
+        "before_phrase_chunks",
+        "phrase_buffer",
+        "phrase_spill",
+        "phrase_truncated",
+        "before_phrase_stats",
+        "phrase_stats",
+        "max_buffers",
+        "min_phrase_buffers",
+        "skip_buffers_left",
+        "speech_buffers_left",
+        "last_speech",
+        "last_energy",
+        "in_phrase",
+        "after_phrase",
+        "silence_buffers",
+        "current_seconds",
+        "current_sample",
+        "start_sample",
+        "phrase_start_sample",
+        "num_before_buffers",
+        "phrase_before_buffers",
+        "vad_run_speech",
+        "vad_run_frames",
+        "vad_run_energy",
+        "vad_skip_left",
+        "vad_frames_inferred",
+        "utterance",
+        "endpoint_stats",
+        "_trace",
+    )
+
     def __init__(
         self,
         vad_mode: int = 3,
@@ -80,313 +201,816 @@ class WebRtcVadRecorder(VoiceCommandRecorder):
         max_current_ratio_threshold: typing.Optional[float] = None,
         current_energy_threshold: typing.Optional[float] = None,
         silence_method: SilenceMethod = SilenceMethod.VAD_ONLY,
+        keep_frame_stats: bool = False,
+        compute_energy: bool = False,
+        max_events: typing.Optional[int] = None,
+        max_phrase_bytes: typing.Optional[int] = None,
+        phrase_overflow: PhraseOverflowPolicy = PhraseOverflowPolicy.TRUNCATE,
+        reset_max_energy: bool = False,
+        reset_vad: bool = False,
+        keep_audio: bool = True,
+        max_energy_seconds: typing.Optional[float] = None,
+        max_energy_percentile: typing.Optional[float] = None,
+        adaptive_vad_frames: typing.Optional[int] = None,
+        adaptive_vad_max_error: float = 0.12,
+        adaptive_vad_energy_ratio: float = 2.0,
+        adaptive_silence: bool = False,
+        adaptive_silence_min_seconds: float = 0.2,
+        adaptive_silence_max_seconds: float = 1.0,
+        adaptive_silence_pause_factor: float = 1.5,
+        adaptive_silence_decay_ratio: float = 10.0,
+        config: typing.Optional[RecorderConfig] = None,
+        trace: typing.Optional[TraceWriter] = None,
     ):
-        self.vad_mode = vad_mode
-        self.sample_rate = sample_rate
-        self.chunk_size = chunk_size
-        self.skip_seconds = skip_seconds
-        self.min_seconds = min_seconds
-        self.max_seconds = max_seconds
-        self.speech_seconds = speech_seconds
-        self.silence_seconds = silence_seconds
-        self.before_seconds = before_seconds
-
-        self.max_energy = max_energy
-        self.dynamic_max_energy = max_energy is None
-        self.max_current_ratio_threshold = max_current_ratio_threshold
-        self.current_energy_threshold = current_energy_threshold
-        self.silence_method = silence_method
-
-        # Verify settings
-        if self.silence_method in [
-            SilenceMethod.VAD_ONLY,
-            SilenceMethod.VAD_AND_RATIO,
-            SilenceMethod.VAD_AND_CURRENT,
-            SilenceMethod.ALL,
-        ]:
-            self.use_vad = True
-        else:
-            self.use_vad = False
-
-        if self.silence_method in [
-            SilenceMethod.VAD_AND_RATIO,
-            SilenceMethod.RATIO_ONLY,
-            SilenceMethod.ALL,
-        ]:
-            self.use_ratio = True
-            assert (
-                self.max_current_ratio_threshold is not None
-            ), "Max/current ratio threshold is required"
-        else:
-            self.use_ratio = False
-
-        if self.silence_method in [
-            SilenceMethod.VAD_AND_CURRENT,
-            SilenceMethod.CURRENT_ONLY,
-            SilenceMethod.ALL,
-        ]:
-            self.use_current = True
-            assert (
-                self.current_energy_threshold is not None
-            ), "Current energy threshold is required"
-        else:
-            self.use_current = False
-
-        # Voice detector
-        self.vad: typing.Optional[webrtcvad.Vad] = None
-        if self.use_vad:
-            assert self.vad_mode in range(
-                1, 4
-            ), f"VAD mode must be 1-3 (got {vad_mode})"
-
-            chunk_ms = 1000 * ((self.chunk_size / 2) / self.sample_rate)
-            assert chunk_ms in [10, 20, 30], (
-                "Sample rate and chunk size must make for 10, 20, or 30 ms buffer sizes,"
-                + f" assuming 16-bit mono audio (got {chunk_ms} ms)"
+        if config is None:
+            config = RecorderConfig(
+                vad_mode=vad_mode,
+                sample_rate=sample_rate,
+                chunk_size=chunk_size,
+                skip_seconds=skip_seconds,
+                min_seconds=min_seconds,
+                max_seconds=max_seconds,
+                speech_seconds=speech_seconds,
+                silence_seconds=silence_seconds,
+                before_seconds=before_seconds,
+                max_energy=max_energy,
+                max_current_ratio_threshold=max_current_ratio_threshold,
+                current_energy_threshold=current_energy_threshold,
+                silence_method=silence_method,
+                keep_frame_stats=keep_frame_stats,
+                compute_energy=compute_energy,
+                max_events=max_events,
+                max_phrase_bytes=max_phrase_bytes,
+                phrase_overflow=phrase_overflow,
+                reset_max_energy=reset_max_energy,
+                reset_vad=reset_vad,
+                keep_audio=keep_audio,
+                max_energy_seconds=max_energy_seconds,
+                max_energy_percentile=max_energy_percentile,
+                adaptive_vad_frames=adaptive_vad_frames,
+                adaptive_vad_max_error=adaptive_vad_max_error,
+                adaptive_vad_energy_ratio=adaptive_vad_energy_ratio,
+                adaptive_silence=adaptive_silence,
+                adaptive_silence_min_seconds=adaptive_silence_min_seconds,
+                adaptive_silence_max_seconds=adaptive_silence_max_seconds,
+                adaptive_silence_pause_factor=adaptive_silence_pause_factor,
+                adaptive_silence_decay_ratio=adaptive_silence_decay_ratio,
             )
 
-            self.vad = webrtcvad.Vad()
-            self.vad.set_mode(self.vad_mode)
+        super().__init__()
+        self.config = config
 
-        self.seconds_per_buffer = self.chunk_size / self.sample_rate
+        # Voice detector (created when needed)
+        self.vad: typing.Optional[webrtcvad.Vad] = None
 
-        # Store some number of seconds of audio data immediately before voice command starts
-        self.before_buffers = int(
-            math.ceil(self.before_seconds / self.seconds_per_buffer)
-        )
+        # Reference energy for max/current ratio (created when needed)
+        self.max_energy: typing.Optional[float] = config.max_energy
+        self.max_energy_tracker: typing.Optional[EnergyTracker] = None
 
-        # Pre-compute values
-        self.speech_buffers = int(
-            math.ceil(self.speech_seconds / self.seconds_per_buffer)
-        )
+        # State (event ring buffer is created when needed)
+        self._events: typing.Optional[typing.Deque[VoiceCommandEvent]] = None
 
-        self.skip_buffers = int(math.ceil(self.skip_seconds / self.seconds_per_buffer))
+        # Audio immediately before voice command starts (created when needed)
+        self.before_phrase_chunks: typing.Optional[typing.Deque[bytes]] = None
+        self.phrase_buffer: typing.Optional[bytearray] = None
 
-        # State
-        self.events: typing.List[VoiceCommandEvent] = []
-        self.before_phrase_chunks: typing.Deque[bytes] = deque(
-            maxlen=self.before_buffers
-        )
-        self.phrase_buffer: bytes = bytes()
+        # All voice command audio once max_phrase_bytes is exceeded (spill policy)
+        self.phrase_spill: typing.Optional[typing.BinaryIO] = None
+        self.phrase_truncated: bool = False
+
+        # (energy, is_speech) for each frame in before_phrase_chunks
+        self.before_phrase_stats: typing.Optional[
+            typing.Deque[typing.Tuple[float, bool]]
+        ] = None
+        self.phrase_stats: typing.Optional[FrameStats] = None
 
         self.max_buffers: typing.Optional[int] = None
         self.min_phrase_buffers: int = 0
         self.skip_buffers_left: int = 0
         self.speech_buffers_left: int = 0
         self.last_speech: bool = False
+
+        # Debiased energy of most recent frame (None if not computed)
+        self.last_energy: typing.Optional[float] = None
         self.in_phrase: bool = False
         self.after_phrase: bool = False
         self.silence_buffers: int = 0
         self.current_seconds: float = 0
-        self.current_chunk: bytes = bytes()
+
+        # Sample offsets into audio stream since start()
+        self.current_sample: int = 0
+
+        # Sample offset of start() in all audio processed by the recorder
+        self.start_sample: int = 0
+        self.phrase_start_sample: typing.Optional[int] = None
+        self.num_before_buffers: int = 0
+        self.phrase_before_buffers: int = 0
+
+        # Current run of identical webrtcvad decisions (adaptive VAD)
+        self.vad_run_speech: bool = False
+        self.vad_run_frames: int = 0
+        self.vad_run_energy: float = 0
+        self.vad_skip_left: int = 0
+
+        # Frames whose webrtcvad result was inferred since start()
+        self.vad_frames_inferred: int = 0
+
+        # Statistics of current voice command (adaptive silence)
+        self.utterance: typing.Optional[UtteranceStats] = None
+
+        # Accumulated over all voice commands (adaptive silence)
+        self.endpoint_stats: typing.Optional[EndpointStats] = None
+        if config.adaptive_silence:
+            self.endpoint_stats = EndpointStats()
+
+        self._trace: typing.Optional[TraceWriter] = None
+        self.trace = trace
+
+    @property
+    def trace(self) -> typing.Optional[TraceWriter]:
+        """Trace of input frames and decisions (None if not traced)."""
+        return self._trace
+
+    @trace.setter
+    def trace(self, trace: typing.Optional[TraceWriter]):
+        """Attach a trace and write recorder settings to it."""
+        if trace is not None:
+            trace.write_config(self.config)
+
+        self._trace = trace
+
+    @property
+    def events(self) -> typing.Deque[VoiceCommandEvent]:
+        """Events of current voice command (only the last max_events are kept)."""
+        if self._events is None:
+            self._events = deque(maxlen=self.config.max_events)
+
+        return self._events
+
+    # Read-only settings from shared configuration (see RecorderConfig)
+
+    @property
+    def vad_mode(self) -> int:
+        """Sensitivity of webrtcvad (1-3)."""
+        return self.config.vad_mode
+
+    @property
+    def sample_rate(self) -> int:
+        """Sample rate of audio chunks (hertz)."""
+        return self.config.sample_rate
+
+    @property
+    def chunk_size(self) -> int:
+        """Bytes per audio frame."""
+        return self.config.chunk_size
+
+    @property
+    def skip_seconds(self) -> float:
+        """Seconds of audio to skip before detection starts."""
+        return self.config.skip_seconds
+
+    @property
+    def min_seconds(self) -> float:
+        """Minimum length of voice command (seconds)."""
+        return self.config.min_seconds
+
+    @property
+    def max_seconds(self) -> typing.Optional[float]:
+        """Maximum length of voice command (seconds)."""
+        return self.config.max_seconds
+
+    @property
+    def speech_seconds(self) -> float:
+        """Seconds of speech before voice command has begun."""
+        return self.config.speech_seconds
+
+    @property
+    def silence_seconds(self) -> float:
+        """Seconds of silence before voice command has finished."""
+        return self.config.silence_seconds
+
+    @property
+    def before_seconds(self) -> float:
+        """Seconds of audio to keep before voice command has begun."""
+        return self.config.before_seconds
+
+    @property
+    def silence_method(self) -> SilenceMethod:
+        """Method used to determine if a frame is silence."""
+        return self.config.silence_method
+
+    @property
+    def current_energy_threshold(self) -> typing.Optional[float]:
+        """Debiased energy threshold of current frame."""
+        return self.config.current_energy_threshold
+
+    @property
+    def max_current_ratio_threshold(self) -> typing.Optional[float]:
+        """Threshold of ratio of max/current energy."""
+        return self.config.max_current_ratio_threshold
+
+    @property
+    def use_vad(self) -> bool:
+        """True if webrtcvad is used."""
+        return self.config.use_vad
+
+    @property
+    def use_ratio(self) -> bool:
+        """True if ratio of max/current energy is used."""
+        return self.config.use_ratio
+
+    @property
+    def use_current(self) -> bool:
+        """True if current energy is used."""
+        return self.config.use_current
+
+    @property
+    def dynamic_max_energy(self) -> bool:
+        """True if max energy is observed from audio."""
+        return self.config.dynamic_max_energy
+
+    @property
+    def seconds_per_buffer(self) -> float:
+        """Seconds per audio frame."""
+        return self.config.seconds_per_buffer
+
+    @property
+    def samples_per_buffer(self) -> int:
+        """Samples per audio frame."""
+        return self.config.samples_per_buffer
+
+    @property
+    def before_buffers(self) -> int:
+        """Frames of audio to keep before voice command has begun."""
+        return self.config.before_buffers
+
+    @property
+    def skip_buffers(self) -> int:
+        """Frames of audio to skip before detection starts."""
+        return self.config.skip_buffers
+
+    @property
+    def speech_buffers(self) -> int:
+        """Frames of speech before voice command has begun."""
+        return self.config.speech_buffers
 
     def start(self):
         """Begin new voice command."""
+        config = self.config
+        if self._trace is not None:
+            self._trace.write_start()
 
         # State
-        self.events.clear()
-        self.before_phrase_chunks.clear()
-        self.phrase_buffer = bytes()
+        if self._events is not None:
+            self._events.clear()
 
-        if self.max_seconds:
-            self.max_buffers = int(
-                math.ceil(self.max_seconds / self.seconds_per_buffer)
-            )
-        else:
-            self.max_buffers = None
+        self._clear_audio()
+        self.current_chunk = bytes()
 
-        self.min_phrase_buffers = int(
-            math.ceil(self.min_seconds / self.seconds_per_buffer)
-        )
+        if config.reset_max_energy and config.dynamic_max_energy:
+            self.max_energy = None
+            if self.max_energy_tracker is not None:
+                self.max_energy_tracker.clear()
 
-        self.speech_buffers_left = self.speech_buffers
-        self.skip_buffers_left = self.skip_buffers
+        self.max_buffers = config.max_seconds_buffers
+        self.min_phrase_buffers = config.min_seconds_buffers
+        self.speech_buffers_left = config.speech_buffers
+        self.skip_buffers_left = config.skip_buffers
         self.last_speech = False
+        self.last_energy = None
         self.in_phrase = False
         self.after_phrase = False
-        self.silence_buffers = int(
-            math.ceil(self.silence_seconds / self.seconds_per_buffer)
-        )
-
-        self.current_seconds: float = 0
-
-        self.current_chunk: bytes = bytes()
-
-    def stop(self) -> bytes:
+        self.silence_buffers = config.silence_seconds_buffers
+
+        self.current_seconds = 0
+        self.start_sample += self.current_sample
+        self.current_sample = 0
+        self.phrase_start_sample = None
+        self.num_before_buffers = 0
+        self.phrase_before_buffers = 0
+
+        self.vad_run_speech = False
+        self.vad_run_frames = 0
+        self.vad_run_energy = 0
+        self.vad_skip_left = 0
+        self.vad_frames_inferred = 0
+        self.utterance = None
+
+    def stop(self) -> AudioBuffer:
         """Free any resources and return recorded audio."""
-        before_buffer = bytes()
-        for before_chunk in self.before_phrase_chunks:
-            before_buffer += before_chunk
-
-        audio_data = before_buffer + self.phrase_buffer
+        audio_data = self._get_audio_data()
 
         # Clear state
-        self.before_phrase_chunks.clear()
-        self.events.clear()
-        self.phrase_buffer = bytes()
+        if self._events is not None:
+            self._events.clear()
+
+        self._clear_audio()
         self.current_chunk = bytes()
 
+        if self.config.reset_vad:
+            # webrtcvad has no public reset
+            self.vad = None
+
+        if self._trace is not None:
+            self._trace.write_stop()
+
         # Return leftover audio
         return audio_data
 
-    def process_chunk(self, audio_chunk: bytes) -> typing.Optional[VoiceCommand]:
-        """Process a single chunk of audio data."""
+    def _clear_audio(self):
+        """Clear recorded audio and frame statistics."""
+        self.before_phrase_chunks = None
+        self.phrase_buffer = None
+        self.before_phrase_stats = None
+        self.phrase_stats = None
+        self.phrase_truncated = False
 
-        # Add to overall buffer
-        self.current_chunk += audio_chunk
+        if self.phrase_spill is not None:
+            self.phrase_spill.close()
+            self.phrase_spill = None
 
-        # Process audio in exact chunk(s)
-        while len(self.current_chunk) > self.chunk_size:
-            # Extract chunk
-            chunk = self.current_chunk[: self.chunk_size]
-            self.current_chunk = self.current_chunk[self.chunk_size :]
+    def process_frame(
+        self,
+        chunk: AudioBuffer,
+        energy: typing.Optional[float] = None,
+        vad_speech: typing.Optional[bool] = None,
+    ) -> typing.Optional[VoiceCommand]:
+        """Process a single frame of exactly chunk_size bytes.
+
+        Precomputed debiased energy and webrtcvad result may be provided.
+        """
+        if self._trace is None:
+            return self._process_frame(chunk, energy=energy, vad_speech=vad_speech)
+
+        config = self.config
+        flags = 0
+        start_ns = time.perf_counter_ns()
+        if self.skip_buffers_left > 0:
+            flags |= TraceFrameFlags.SKIPPED
+        elif (energy is None) and (
+            config.use_ratio
+            or config.use_current
+            or config.keep_frame_stats
+            or config.compute_energy
+            or self._trace.energy
+        ):
+            # Computed once and shared with is_silence
+            energy = WebRtcVadRecorder.get_debiased_energy(chunk)
 
-            if self.skip_buffers_left > 0:
-                # Skip audio at beginning
-                self.skip_buffers_left -= 1
-                continue
+        command = self._process_frame(chunk, energy=energy, vad_speech=vad_speech)
+        duration_ns = time.perf_counter_ns() - start_ns
 
-            if self.in_phrase:
-                self.phrase_buffer += chunk
-            else:
-                self.before_phrase_chunks.append(chunk)
-
-            self.current_seconds += self.seconds_per_buffer
-
-            # Check maximum number of seconds to record
-            if self.max_buffers:
-                self.max_buffers -= 1
-                if self.max_buffers <= 0:
-                    # Timeout
-                    self.events.append(
-                        VoiceCommandEvent(
-                            type=VoiceCommandEventType.TIMEOUT,
-                            time=self.current_seconds,
-                        )
-                    )
-                    return VoiceCommand(
-                        result=VoiceCommandResult.FAILURE, events=self.events
-                    )
+        if self.last_speech:
+            flags |= TraceFrameFlags.SPEECH
 
-            # Detect speech in chunk
-            is_speech = not self.is_silence(chunk)
-            if is_speech and not self.last_speech:
-                # Silence -> speech
-                self.events.append(
-                    VoiceCommandEvent(
-                        type=VoiceCommandEventType.SPEECH, time=self.current_seconds
-                    )
-                )
-            elif not is_speech and self.last_speech:
-                # Speech -> silence
-                self.events.append(
-                    VoiceCommandEvent(
-                        type=VoiceCommandEventType.SILENCE, time=self.current_seconds
-                    )
-                )
+        if command is not None:
+            flags |= TraceFrameFlags.COMMAND
 
-            self.last_speech = is_speech
+        self._trace.write_frame(
+            chunk,
+            flags=flags,
+            energy=energy,
+            start_ns=start_ns,
+            duration_ns=duration_ns,
+        )
 
-            # Handle state changes
-            if is_speech and self.speech_buffers_left > 0:
-                self.speech_buffers_left -= 1
-            elif is_speech and not self.in_phrase:
-                # Start of phrase
-                self.events.append(
-                    VoiceCommandEvent(
-                        type=VoiceCommandEventType.STARTED, time=self.current_seconds
-                    )
-                )
-                self.in_phrase = True
-                self.after_phrase = False
-                self.min_phrase_buffers = int(
-                    math.ceil(self.min_seconds / self.seconds_per_buffer)
+        return command
+
+    def _process_frame(
+        self,
+        chunk: AudioBuffer,
+        energy: typing.Optional[float] = None,
+        vad_speech: typing.Optional[bool] = None,
+    ) -> typing.Optional[VoiceCommand]:
+        """Process a single frame without tracing."""
+        config = self.config
+        self.current_sample += config.samples_per_buffer
+        self.last_energy = None
+
+        if self.skip_buffers_left > 0:
+            # Skip audio at beginning
+            self.skip_buffers_left -= 1
+            return None
+
+        frame_in_phrase = self.in_phrase
+        frame_kept = True
+        if frame_in_phrase:
+            if config.keep_audio:
+                frame_kept = self._add_phrase_audio(chunk)
+        else:
+            self.num_before_buffers = min(
+                config.before_buffers, self.num_before_buffers + 1
+            )
+            if config.keep_audio:
+                if self.before_phrase_chunks is None:
+                    self.before_phrase_chunks = deque(maxlen=config.before_buffers)
+
+                # Frame may be a view into the caller's buffer
+                self.before_phrase_chunks.append(bytes(chunk))
+
+        if (energy is None) and (config.keep_frame_stats or config.compute_energy):
+            # Computed once and shared with is_silence
+            energy = WebRtcVadRecorder.get_debiased_energy(chunk)
+
+        self.last_energy = energy
+        self.current_seconds += config.seconds_per_buffer
+
+        # Check maximum number of seconds to record
+        if self.max_buffers:
+            self.max_buffers -= 1
+            if self.max_buffers <= 0:
+                # Timeout
+                if config.keep_frame_stats and (energy is not None) and frame_kept:
+                    self._add_frame_stats(frame_in_phrase, energy, False)
+
+                self._add_event(VoiceCommandEventType.TIMEOUT)
+                return VoiceCommand(
+                    result=VoiceCommandResult.FAILURE,
+                    events=list(self.events),
+                    frame_stats=self._get_frame_stats(),
+                    segment=self._get_segment(),
                 )
-            elif self.in_phrase and (self.min_phrase_buffers > 0):
-                # In phrase, before minimum seconds
-                self.min_phrase_buffers -= 1
-            elif not is_speech:
-                # Outside of speech
-                if not self.in_phrase:
-                    # Reset
-                    self.speech_buffers_left = self.speech_buffers
-                elif self.after_phrase and (self.silence_buffers > 0):
-                    # After phrase, before stop
-                    self.silence_buffers -= 1
-                elif self.after_phrase and (self.silence_buffers <= 0):
-                    # Phrase complete
-                    self.events.append(
-                        VoiceCommandEvent(
-                            type=VoiceCommandEventType.STOPPED,
-                            time=self.current_seconds,
-                        )
-                    )
 
-                    # Merge before/during command audio data
-                    before_buffer = bytes()
-                    for before_chunk in self.before_phrase_chunks:
-                        before_buffer += before_chunk
+        # Detect speech in chunk
+        is_speech = not self.is_silence(chunk, energy=energy, vad_speech=vad_speech)
+        if config.keep_frame_stats and (energy is not None) and frame_kept:
+            self._add_frame_stats(frame_in_phrase, energy, is_speech)
+
+        if (
+            config.compute_energy
+            and (energy is not None)
+            and config.dynamic_max_energy
+            and not config.use_ratio
+        ):
+            # Keep reference energy for get_max_current_ratio
+            self._update_max_energy(energy)
+
+        if is_speech and not self.last_speech:
+            # Silence -> speech
+            self._add_event(VoiceCommandEventType.SPEECH)
+        elif not is_speech and self.last_speech:
+            # Speech -> silence
+            self._add_event(VoiceCommandEventType.SILENCE)
+
+        self.last_speech = is_speech
+
+        if self.utterance is not None:
+            self._add_utterance_frame(chunk, is_speech, energy)
+
+        # Handle state changes
+        if is_speech and self.speech_buffers_left > 0:
+            self.speech_buffers_left -= 1
+        elif is_speech and not self.in_phrase:
+            # Start of phrase
+            self._add_event(VoiceCommandEventType.STARTED)
+            self.in_phrase = True
+            self.after_phrase = False
+            self.phrase_start_sample = self.current_sample
+            self.phrase_before_buffers = self.num_before_buffers
+            self.min_phrase_buffers = config.min_seconds_buffers
+
+            if config.adaptive_silence:
+                # Frames of speech before start
+                self.utterance = UtteranceStats()
+                self.utterance.speech_run_frames = config.speech_buffers
+                self._add_utterance_frame(chunk, is_speech, energy)
+        elif self.in_phrase and (self.min_phrase_buffers > 0):
+            # In phrase, before minimum seconds
+            self.min_phrase_buffers -= 1
+        elif not is_speech:
+            # Outside of speech
+            if not self.in_phrase:
+                # Reset
+                self.speech_buffers_left = config.speech_buffers
+            elif self.after_phrase and (self.utterance is not None):
+                # After phrase, adaptive stop
+                latency_saved = self._check_adaptive_stop()
+                if latency_saved is not None:
+                    self._add_event(VoiceCommandEventType.STOPPED)
+
+                    assert self.endpoint_stats is not None
+                    self.endpoint_stats.add(latency_saved)
 
                     return VoiceCommand(
                         result=VoiceCommandResult.SUCCESS,
-                        audio_data=before_buffer + self.phrase_buffer,
-                        events=self.events,
-                    )
-                elif self.in_phrase and (self.min_phrase_buffers <= 0):
-                    # Transition to after phrase
-                    self.after_phrase = True
-                    self.silence_buffers = int(
-                        math.ceil(self.silence_seconds / self.seconds_per_buffer)
+                        audio_data=(
+                            self._get_audio_data() if config.keep_audio else None
+                        ),
+                        events=list(self.events),
+                        frame_stats=self._get_frame_stats(),
+                        segment=self._get_segment(),
+                        latency_saved=latency_saved,
                     )
+            elif self.after_phrase and (self.silence_buffers > 0):
+                # After phrase, before stop
+                self.silence_buffers -= 1
+            elif self.after_phrase and (self.silence_buffers <= 0):
+                # Phrase complete
+                self._add_event(VoiceCommandEventType.STOPPED)
+
+                return VoiceCommand(
+                    result=VoiceCommandResult.SUCCESS,
+                    audio_data=self._get_audio_data() if config.keep_audio else None,
+                    events=list(self.events),
+                    frame_stats=self._get_frame_stats(),
+                    segment=self._get_segment(),
+                )
+            elif self.in_phrase and (self.min_phrase_buffers <= 0):
+                # Transition to after phrase
+                self.after_phrase = True
+                self.silence_buffers = config.silence_seconds_buffers
 
         return None
 
+    def _add_utterance_frame(
+        self, chunk: AudioBuffer, is_speech: bool, energy: typing.Optional[float]
+    ):
+        """Add frame to statistics of current voice command (adaptive silence)."""
+        assert self.utterance is not None
+        if energy is None:
+            energy = WebRtcVadRecorder.get_debiased_energy(chunk)
+
+        self.utterance.add(is_speech, energy)
+
+    def _check_adaptive_stop(self) -> typing.Optional[float]:
+        """Get latency saved if voice command has finished (adaptive silence)."""
+        assert self.utterance is not None
+        config = self.config
+
+        # Keep track of where a fixed silence_seconds would have stopped
+        if self.silence_buffers > 0:
+            self.silence_buffers -= 1
+        elif self.utterance.fixed_stop_sample is None:
+            self.utterance.fixed_stop_sample = self.current_sample
+
+        if self.utterance.silence_run_frames < self.utterance.get_silence_buffers(
+            config
+        ):
+            return None
+
+        if self.utterance.fixed_stop_sample is not None:
+            # Extended
+            return -(
+                (self.current_sample - self.utterance.fixed_stop_sample)
+                / config.sample_rate
+            )
+
+        # Assume silence would have continued
+        return (
+            (self.silence_buffers + 1) * config.samples_per_buffer
+        ) / config.sample_rate
+
+    def _add_event(self, event_type: VoiceCommandEventType):
+        """Add event at the end of the current frame."""
+        # Oldest event is dropped beyond max_events
+        self.events.append(
+            VoiceCommandEvent(
+                type=event_type, time=self.current_seconds, sample=self.current_sample
+            )
+        )
+
+    def _get_segment(self) -> typing.Optional[AudioSegment]:
+        """Get sample offsets of the current voice command (None if not started)."""
+        if self.phrase_start_sample is None:
+            return None
+
+        start_sample = self.start_sample + self.phrase_start_sample
+
+        return AudioSegment(
+            before_start=start_sample
+            - (self.phrase_before_buffers * self.config.samples_per_buffer),
+            start=start_sample,
+            end=self.start_sample + self.current_sample,
+        )
+
+    def _add_phrase_audio(self, chunk: AudioBuffer) -> bool:
+        """Add frame to voice command audio. False if frame was dropped."""
+        config = self.config
+        if self.phrase_spill is not None:
+            # Already spilled
+            self.phrase_spill.write(chunk)
+            return True
+
+        if self.phrase_buffer is None:
+            self.phrase_buffer = bytearray()
+
+        if (config.max_phrase_bytes is None) or (
+            (len(self.phrase_buffer) + len(chunk)) <= config.max_phrase_bytes
+        ):
+            self.phrase_buffer += chunk
+            return True
+
+        if config.phrase_overflow == PhraseOverflowPolicy.SPILL:
+            _LOGGER.debug(
+                "Voice command exceeded %s byte(s); spilling audio to disk",
+                config.max_phrase_bytes,
+            )
+
+            # Move all audio to file so memory stays bounded
+            self.phrase_spill = tempfile.TemporaryFile()
+            for before_chunk in self.before_phrase_chunks or []:
+                self.phrase_spill.write(before_chunk)
+
+            self.phrase_spill.write(self.phrase_buffer)
+            self.phrase_spill.write(chunk)
+
+            self.before_phrase_chunks = None
+            self.phrase_buffer = None
+
+            # Frame statistics would no longer be bounded
+            self.phrase_stats = None
+
+            return True
+
+        # Truncate
+        if not self.phrase_truncated:
+            _LOGGER.warning(
+                "Voice command exceeded %s byte(s); dropping audio",
+                config.max_phrase_bytes,
+            )
+            self.phrase_truncated = True
+
+        return False
+
+    def _get_audio_data(self) -> AudioBuffer:
+        """Merge before/during command audio data.
+
+        Spilled audio is returned as a read-only view of the memory-mapped file
+        instead of being read back into memory.
+        """
+        if self.phrase_spill is not None:
+            self.phrase_spill.flush()
+            return memoryview(
+                mmap.mmap(self.phrase_spill.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+
+        return b"".join(
+            itertools.chain(
+                self.before_phrase_chunks or [], [self.phrase_buffer or bytes()]
+            )
+        )
+
+    def _add_frame_stats(self, in_phrase: bool, energy: float, is_speech: bool):
+        """Record statistics for the most recently buffered frame."""
+        if in_phrase:
+            if self.phrase_spill is not None:
+                # Not kept for spilled voice commands
+                return
+
+            if self.phrase_stats is None:
+                self.phrase_stats = FrameStats(chunk_size=self.config.chunk_size)
+
+            self.phrase_stats.energies.append(energy)
+            self.phrase_stats.speech.append(1 if is_speech else 0)
+        else:
+            if self.before_phrase_stats is None:
+                self.before_phrase_stats = deque(maxlen=self.config.before_buffers)
+
+            self.before_phrase_stats.append((energy, is_speech))
+
+    def _get_frame_stats(self) -> typing.Optional[FrameStats]:
+        """Merge before/during command frame statistics (aligned with audio data)."""
+        if (not self.config.keep_frame_stats) or (self.phrase_spill is not None):
+            return None
+
+        before_phrase_stats: typing.Sequence[typing.Tuple[float, bool]] = (
+            self.before_phrase_stats or []
+        )
+        frame_stats = FrameStats(
+            chunk_size=self.config.chunk_size,
+            energies=array.array("f", (energy for energy, _ in before_phrase_stats)),
+            speech=bytearray(
+                1 if is_speech else 0 for _, is_speech in before_phrase_stats
+            ),
+        )
+
+        if self.phrase_stats is not None:
+            frame_stats.energies.extend(self.phrase_stats.energies)
+            frame_stats.speech.extend(self.phrase_stats.speech)
+
+        return frame_stats
+
     # -------------------------------------------------------------------------
 
-    def is_silence(self, chunk: bytes) -> bool:
-        """True if audio chunk contains silence."""
+    def is_silence(
+        self,
+        chunk: AudioBuffer,
+        energy: typing.Optional[float] = None,
+        vad_speech: typing.Optional[bool] = None,
+    ) -> bool:
+        """True if audio chunk contains silence.
+
+        A precomputed debiased energy and webrtcvad result for the chunk may be
+        provided.
+        """
+        config = self.config
+        chunk = _byte_view(chunk)
         all_silence = True
 
-        if self.use_vad:
+        if config.use_vad:
             # Use VAD to detect speech
-            assert self.vad is not None
-            all_silence = all_silence and (
-                not self.vad.is_speech(chunk, self.sample_rate)
-            )
+            if vad_speech is None:
+                vad_speech = self.get_vad_speech(chunk)
+
+            all_silence = all_silence and (not vad_speech)
 
-        if self.use_ratio or self.use_current:
+        if config.use_ratio or config.use_current:
             # Compute debiased energy of audio chunk
-            energy = WebRtcVadRecorder.get_debiased_energy(chunk)
-            if self.use_ratio:
+            if energy is None:
+                energy = WebRtcVadRecorder.get_debiased_energy(chunk)
+            if config.use_ratio:
                 # Ratio of max/current energy compared to threshold
-                if self.dynamic_max_energy:
-                    # Overwrite max energy
-                    if self.max_energy is None:
-                        self.max_energy = energy
-                    else:
-                        self.max_energy = max(energy, self.max_energy)
-
-                assert self.max_energy is not None
-                if energy > 0:
-                    ratio = self.max_energy / energy
-                else:
-                    # Not sure what to do here
-                    ratio = 0
-
-                assert self.max_current_ratio_threshold is not None
-                all_silence = all_silence and (ratio > self.max_current_ratio_threshold)
-            elif self.use_current:
+                if config.dynamic_max_energy:
+                    self._update_max_energy(energy)
+
+                ratio = self.get_max_current_ratio(energy)
+
+                assert config.max_current_ratio_threshold is not None
+                all_silence = all_silence and (
+                    ratio > config.max_current_ratio_threshold
+                )
+            elif config.use_current:
                 # Current energy compared to threshold
-                assert self.current_energy_threshold is not None
-                all_silence = all_silence and (energy < self.current_energy_threshold)
+                assert config.current_energy_threshold is not None
+                all_silence = all_silence and (energy < config.current_energy_threshold)
 
         return all_silence
 
+    def get_max_current_ratio(self, energy: float) -> float:
+        """Ratio of max energy to debiased energy of a frame."""
+        assert self.max_energy is not None, "Max energy not set"
+        if energy > 0:
+            return self.max_energy / energy
+
+        # Not sure what to do here
+        return 0
+
+    def _update_max_energy(self, energy: float):
+        """Add frame energy to dynamic max energy."""
+        if self.max_energy_tracker is None:
+            self.max_energy_tracker = get_energy_tracker(
+                window_frames=self.config.max_energy_buffers,
+                percentile=self.config.max_energy_percentile,
+            )
+
+        # Overwrite max energy
+        self.max_energy = self.max_energy_tracker.add(energy)
+
+    def get_vad_speech(self, chunk: AudioBuffer) -> bool:
+        """True if webrtcvad detects speech in audio chunk.
+
+        With adaptive_vad_frames, webrtcvad is only run every
+        adaptive_vad_interval frames once that many identical decisions have
+        been made. Skipped frames get the decision of the current run. Full rate
+        resumes as soon as the RMS energy of a frame changes by more than
+        adaptive_vad_energy_ratio from the last analyzed frame.
+        """
+        config = self.config
+        chunk = _byte_view(chunk)
+
+        energy = 0
+        if config.adaptive_vad_frames is not None:
+            # Much cheaper than webrtcvad or debiased energy
+            energy = max(1, audioop.rms(chunk, 2))
+            energy_ratio = energy / max(1, self.vad_run_energy)
+            if (energy_ratio > config.adaptive_vad_energy_ratio) or (
+                (energy_ratio * config.adaptive_vad_energy_ratio) < 1
+            ):
+                # Back to full rate
+                self.vad_run_frames = 0
+                self.vad_skip_left = 0
+            elif self.vad_skip_left > 0:
+                # Infer decision
+                self.vad_skip_left -= 1
+                self.vad_frames_inferred += 1
+                return self.vad_run_speech
+
+        if self.vad is None:
+            self.vad = webrtcvad.Vad(config.vad_mode)
+
+        vad_speech = self.vad.is_speech(chunk, config.sample_rate)
+
+        if config.adaptive_vad_frames is not None:
+            if (self.vad_run_frames > 0) and (vad_speech == self.vad_run_speech):
+                self.vad_run_frames += 1
+            else:
+                # New run
+                self.vad_run_speech = vad_speech
+                self.vad_run_frames = 1
+
+            self.vad_run_energy = energy
+            if self.vad_run_frames >= config.adaptive_vad_frames:
+                self.vad_skip_left = config.adaptive_vad_interval - 1
+
+        return vad_speech
+
     # -------------------------------------------------------------------------
 
     @staticmethod
-    def get_debiased_energy(audio_data: bytes) -> float:
+    def get_debiased_energy(audio_data: AudioBuffer) -> float:
         """Compute RMS of debiased audio."""
+        audio_data = _byte_view(audio_data)
+
         # Thanks to the speech_recognition library!
         # https://github.com/Uberi/speech_recognition/blob/master/speech_recognition/__init__.py
         energy = -audioop.rms(audio_data, 2)
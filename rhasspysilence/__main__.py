@@ -8,9 +8,18 @@ import wave
 from enum import Enum
 from pathlib import Path
 
-from . import WebRtcVadRecorder
-from .const import SilenceMethod, VoiceCommandEventType
-from .utils import trim_silence
+from . import WebRtcVadRecorder, _byte_view
+from .const import AudioBuffer, SilenceMethod, VoiceCommandEventType
+from .pipeline import (
+    ConvertStage,
+    Pipeline,
+    RecorderStage,
+    Stage,
+    StageMode,
+    TrimStage,
+    WavWriterStage,
+)
+from .trace import TraceWriter
 
 # -----------------------------------------------------------------------------
 
@@ -33,6 +42,11 @@ _LOGGER = logging.getLogger("rhasspysilence")
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(prog="rhasspy-silence")
+    parser.add_argument(
+        "audio_file",
+        nargs="*",
+        help="WAV/FLAC/OGG file(s) to read (default: raw 16Khz mono audio on stdin)",
+    )
     parser.add_argument(
         "--output-type",
         default=OutputType.SPEECH_SILENCE,
@@ -43,7 +57,7 @@ def main():
         "--chunk-size",
         type=int,
         default=960,
-        help="Size of audio chunks. Must be 10, 20, or 30 ms for VAD.",
+        help="Size of audio chunks to read from stdin or pass to the recorder",
     )
     parser.add_argument(
         "--skip-seconds",
@@ -97,6 +111,16 @@ def main():
         type=float,
         help="Fixed maximum energy for ratio calculation (default: observed)",
     )
+    parser.add_argument(
+        "--max-energy-seconds",
+        type=float,
+        help="Seconds of audio over which observed max energy is tracked (default: all)",
+    )
+    parser.add_argument(
+        "--max-energy-percentile",
+        type=float,
+        help="Use percentile (0-100) of observed energy instead of max",
+    )
     parser.add_argument(
         "--max-current-ratio-threshold",
         type=float,
@@ -108,6 +132,40 @@ def main():
         default=SilenceMethod.VAD_ONLY,
         help="Method for detecting silence",
     )
+    parser.add_argument(
+        "--adaptive-vad-frames",
+        type=int,
+        help="Run VAD less often after this many identical decisions",
+    )
+    parser.add_argument(
+        "--adaptive-vad-max-error",
+        type=float,
+        default=0.12,
+        help="Maximum seconds a speech/silence change may be detected late (default: 0.12)",
+    )
+    parser.add_argument(
+        "--adaptive-vad-energy-ratio",
+        type=float,
+        default=2.0,
+        help="Change in frame energy that restores full-rate VAD (default: 2)",
+    )
+    parser.add_argument(
+        "--adaptive-silence",
+        action="store_true",
+        help="Adapt seconds of silence before stop to pauses/energy of each command",
+    )
+    parser.add_argument(
+        "--adaptive-silence-min-seconds",
+        type=float,
+        default=0.2,
+        help="Minimum seconds of silence before stop (default: 0.2)",
+    )
+    parser.add_argument(
+        "--adaptive-silence-max-seconds",
+        type=float,
+        default=1.0,
+        help="Maximum seconds of silence before stop (default: 1.0)",
+    )
 
     # Splitting and trimming by silence
     parser.add_argument(
@@ -149,6 +207,28 @@ def main():
         help="Number of audio chunks after speech to keep (only with --trim-silence)",
     )
 
+    parser.add_argument(
+        "--stage-mode",
+        choices=[e.value for e in StageMode],
+        default=StageMode.INLINE,
+        help="Run trimming/writing stages inline, on threads, or in processes",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        help="Maximum number of voice commands waiting between stages",
+    )
+    parser.add_argument(
+        "--stage-stats",
+        action="store_true",
+        help="Print throughput and queue depth of each stage at the end",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Append input frames and decisions to a trace file (see rhasspysilence.replay)",
+    )
+
     parser.add_argument("--quiet", action="store_true", help="Set output type to none")
 
     parser.add_argument(
@@ -171,134 +251,274 @@ def main():
         args.split_dir = Path(args.split_dir)
         args.split_dir.mkdir(parents=True, exist_ok=True)
 
-    print("Reading raw 16Khz mono audio from stdin...", file=sys.stderr)
-
     try:
-        recorder = WebRtcVadRecorder(
-            max_seconds=args.max_seconds,
-            vad_mode=args.sensitivity,
-            skip_seconds=args.skip_seconds,
-            min_seconds=args.min_seconds,
-            speech_seconds=args.speech_seconds,
-            silence_seconds=args.silence_seconds,
-            before_seconds=args.before_seconds,
-            silence_method=args.silence_method,
-            current_energy_threshold=args.current_threshold,
-            max_energy=args.max_energy,
-            max_current_ratio_threshold=args.max_current_ratio_threshold,
-        )
-
-        dynamic_max_energy = args.max_energy is None
-        max_energy: typing.Optional[float] = args.max_energy
         split_index = 0
 
-        recorder.start()
-
-        while True:
-            chunk = sys.stdin.buffer.read(args.chunk_size)
-            if not chunk:
-                break
+        # Energy is computed by the recorder only for printing
+        print_energy = args.output_type in (
+            OutputType.CURRENT_ENERGY,
+            OutputType.MAX_CURRENT_RATIO,
+        )
 
-            result = recorder.process_chunk(chunk)
+        def print_chunk(recorder: WebRtcVadRecorder, chunk: AudioBuffer):
             output = ""
 
-            if args.output_type != OutputType.NONE:
-                # Print voice command events
-                for event in recorder.events:
-                    if event.type == VoiceCommandEventType.STARTED:
-                        output += "["
-                    elif event.type == VoiceCommandEventType.STOPPED:
-                        output += "]"
-                    elif event.type == VoiceCommandEventType.SPEECH:
-                        output += "S"
-                    elif event.type == VoiceCommandEventType.SILENCE:
-                        output += "-"
-                    elif event.type == VoiceCommandEventType.TIMEOUT:
-                        output += "T"
-
-                recorder.events.clear()
-
-                # Print speech/silence
-                if args.output_type == OutputType.SPEECH_SILENCE:
-                    if recorder.last_speech:
-                        output += "!"
-                    else:
-                        output += "."
-                elif args.output_type == OutputType.CURRENT_ENERGY:
-                    # Debiased energy of current chunk
-                    energy = int(WebRtcVadRecorder.get_debiased_energy(chunk))
-                    output += f"{energy} "
-                elif args.output_type == OutputType.MAX_CURRENT_RATIO:
-                    # Ratio of max/current energy
-                    energy = WebRtcVadRecorder.get_debiased_energy(chunk)
-                    if dynamic_max_energy:
-                        if max_energy is None:
-                            max_energy = energy
-                        else:
-                            max_energy = max(energy, max_energy)
-
-                    assert max_energy is not None, "Max energy not set"
-                    ratio = max_energy / energy if energy > 0.0 else 0.0
-                    output += f"{ratio:.2f} "
-
-                print(output, end="", flush=True)
-
-            if result:
-                # Reset after voice command
-                audio_bytes = recorder.stop()
-
-                if args.split_dir:
-                    # Split audio
-                    if args.trim_silence:
-                        audio_bytes = trim_silence(
-                            audio_bytes,
-                            chunk_size=args.trim_chunk_size,
-                            ratio_threshold=args.trim_ratio,
-                            keep_chunks_before=args.trim_keep_before,
-                            keep_chunks_after=args.trim_keep_after,
-                        )
-
-                    split_wav_path = args.split_dir / args.split_format.format(
-                        split_index
-                    )
-
-                    wav_file: wave.Wave_write = wave.open(str(split_wav_path), "wb")
-                    with wav_file:
-                        wav_file.setframerate(recorder.sample_rate)
-                        wav_file.setsampwidth(2)
-                        wav_file.setnchannels(1)
-                        wav_file.writeframes(audio_bytes)
-
-                    _LOGGER.info("Wrote %s", split_wav_path)
-                    split_index += 1
-                elif args.trim_silence:
-                    # Trim silence without splitting
-                    audio_bytes = trim_silence(
-                        audio_bytes,
+            # Print voice command events
+            for event in recorder.events:
+                if event.type == VoiceCommandEventType.STARTED:
+                    output += "["
+                elif event.type == VoiceCommandEventType.STOPPED:
+                    output += "]"
+                elif event.type == VoiceCommandEventType.SPEECH:
+                    output += "S"
+                elif event.type == VoiceCommandEventType.SILENCE:
+                    output += "-"
+                elif event.type == VoiceCommandEventType.TIMEOUT:
+                    output += "T"
+
+            recorder.events.clear()
+
+            # Print speech/silence
+            if args.output_type == OutputType.SPEECH_SILENCE:
+                if recorder.last_speech:
+                    output += "!"
+                else:
+                    output += "."
+            elif recorder.last_energy is None:
+                # Skipped chunk
+                pass
+            elif args.output_type == OutputType.CURRENT_ENERGY:
+                # Debiased energy of current chunk
+                output += f"{int(recorder.last_energy)} "
+            elif args.output_type == OutputType.MAX_CURRENT_RATIO:
+                # Ratio of max/current energy
+                ratio = recorder.get_max_current_ratio(recorder.last_energy)
+                output += f"{ratio:.2f} "
+
+            print(output, end="", flush=True)
+
+        for sample_rate, chunks in get_audio_sources(args):
+            recorder = WebRtcVadRecorder(
+                sample_rate=sample_rate,
+                chunk_size=get_chunk_size(sample_rate),
+                max_seconds=args.max_seconds,
+                vad_mode=args.sensitivity,
+                skip_seconds=args.skip_seconds,
+                min_seconds=args.min_seconds,
+                speech_seconds=args.speech_seconds,
+                silence_seconds=args.silence_seconds,
+                before_seconds=args.before_seconds,
+                silence_method=args.silence_method,
+                current_energy_threshold=args.current_threshold,
+                max_energy=args.max_energy,
+                max_current_ratio_threshold=args.max_current_ratio_threshold,
+                keep_frame_stats=args.trim_silence,
+                compute_energy=print_energy,
+                max_energy_seconds=args.max_energy_seconds,
+                max_energy_percentile=args.max_energy_percentile,
+                adaptive_vad_frames=args.adaptive_vad_frames,
+                adaptive_vad_max_error=args.adaptive_vad_max_error,
+                adaptive_vad_energy_ratio=args.adaptive_vad_energy_ratio,
+                adaptive_silence=args.adaptive_silence,
+                adaptive_silence_min_seconds=args.adaptive_silence_min_seconds,
+                adaptive_silence_max_seconds=args.adaptive_silence_max_seconds,
+            )
+
+            if args.trace:
+                recorder.trace = TraceWriter(args.trace)
+
+            # Read -> segment -> trim -> write
+            stages: typing.List[Stage] = [
+                RecorderStage(
+                    recorder,
+                    chunk_callback=(
+                        print_chunk if args.output_type != OutputType.NONE else None
+                    ),
+                )
+            ]
+
+            if args.trim_silence:
+                stages.append(
+                    TrimStage(
                         chunk_size=args.trim_chunk_size,
                         ratio_threshold=args.trim_ratio,
                         keep_chunks_before=args.trim_keep_before,
                         keep_chunks_after=args.trim_keep_after,
+                        mode=args.stage_mode,
+                        queue_size=args.queue_size,
+                    )
+                )
+
+            if args.split_dir:
+                stages.append(
+                    WavWriterStage(
+                        args.split_dir,
+                        name_format=args.split_format,
+                        sample_rate=recorder.sample_rate,
+                        wav_index=split_index,
+                        mode=args.stage_mode,
+                        queue_size=args.queue_size,
                     )
+                )
 
+            pipeline = Pipeline(stages)
+            for output in pipeline.run(chunks):
+                if args.split_dir:
+                    # Split audio
+                    _LOGGER.info("Wrote %s", output)
+                    split_index += 1
+                elif args.trim_silence:
+                    # Trim silence without splitting
                     with io.BytesIO() as wav_io:
                         wav_file: wave.Wave_write = wave.open(wav_io, "wb")
                         with wav_file:
                             wav_file.setframerate(recorder.sample_rate)
                             wav_file.setsampwidth(2)
                             wav_file.setnchannels(1)
-                            wav_file.writeframes(audio_bytes)
+                            wav_file.writeframes(output.audio_data)
 
                         sys.stdout.buffer.write(wav_io.getvalue())
 
                     break
 
-                recorder.start()
+            if args.stage_stats:
+                for stage_name, stage_stats in pipeline.stats.items():
+                    _LOGGER.info(
+                        "%s: %s item(s) in, %s item(s) out, %.2f item(s)/sec, max queue depth %s",
+                        stage_name,
+                        stage_stats.items_in,
+                        stage_stats.items_out,
+                        stage_stats.throughput,
+                        stage_stats.max_queue_depth,
+                    )
+
+            if recorder.endpoint_stats is not None:
+                endpoint_stats = recorder.endpoint_stats
+                _LOGGER.info(
+                    "Adaptive silence: %s command(s), %s early, %s late, %.3f sec(s) saved on average",
+                    endpoint_stats.commands,
+                    endpoint_stats.early,
+                    endpoint_stats.late,
+                    endpoint_stats.mean_saved_seconds,
+                )
+
+            if recorder.trace is not None:
+                recorder.trace.close()
+                _LOGGER.info("Wrote trace to %s", args.trace)
 
     except KeyboardInterrupt:
         pass
 
 
+# -----------------------------------------------------------------------------
+
+# Sample rates supported by webrtcvad
+_VAD_SAMPLE_RATES = {8000, 16000, 32000, 48000}
+
+# Number of audio frames decoded from files at a time
+_FILE_BLOCK_FRAMES = 64 * 1024
+
+
+def get_chunk_size(sample_rate: int) -> int:
+    """Size of a 30 ms chunk of 16-bit mono audio (bytes)."""
+    return (sample_rate * 30 // 1000) * 2
+
+
+def get_audio_sources(
+    args: argparse.Namespace,
+) -> typing.Iterable[typing.Tuple[int, typing.Iterable[AudioBuffer]]]:
+    """Yield sample rate and 16-bit mono audio chunks for each input."""
+    if not args.audio_file:
+        print("Reading raw 16Khz mono audio from stdin...", file=sys.stderr)
+        yield 16000, iter(lambda: sys.stdin.buffer.read(args.chunk_size), b"")
+        return
+
+    for audio_path in args.audio_file:
+        _LOGGER.debug("Reading %s", audio_path)
+        sample_rate, blocks = read_audio_file(Path(audio_path))
+
+        # Large decoded blocks are passed to the recorder as zero-copy slices
+        yield sample_rate, (
+            block_view[offset : offset + args.chunk_size]
+            for block_view in map(_byte_view, blocks)
+            for offset in range(0, len(block_view), args.chunk_size)
+        )
+
+
+def read_audio_file(
+    audio_path: Path,
+) -> typing.Tuple[int, typing.Iterable[AudioBuffer]]:
+    """Open WAV file (or FLAC/OGG with soundfile) and stream decoded blocks.
+
+    Blocks are 16-bit mono audio, resampled to 16Khz if webrtcvad does not
+    support the file's sample rate.
+    """
+    if audio_path.suffix.lower() == ".wav":
+        try:
+            wav_file: wave.Wave_read = wave.open(str(audio_path), "rb")
+            return _convert_blocks(
+                _read_wav_blocks(wav_file),
+                sample_rate=wav_file.getframerate(),
+                sample_width=wav_file.getsampwidth(),
+                channels=wav_file.getnchannels(),
+            )
+        except wave.Error:
+            # Not PCM (e.g., floating point)
+            _LOGGER.debug("Falling back to soundfile for %s", audio_path)
+
+    try:
+        import soundfile
+    except ImportError as e:
+        raise RuntimeError(
+            f"soundfile package is required to read {audio_path} (pip install soundfile)"
+        ) from e
+
+    sound_file = soundfile.SoundFile(str(audio_path))
+
+    def read_blocks():
+        with sound_file:
+            yield from sound_file.blocks(blocksize=_FILE_BLOCK_FRAMES, dtype="int16")
+
+    return _convert_blocks(
+        read_blocks(),
+        sample_rate=sound_file.samplerate,
+        sample_width=2,
+        channels=sound_file.channels,
+    )
+
+
+def _read_wav_blocks(wav_file: wave.Wave_read) -> typing.Iterable[bytes]:
+    with wav_file:
+        while True:
+            frames = wav_file.readframes(_FILE_BLOCK_FRAMES)
+            if not frames:
+                break
+
+            yield frames
+
+
+def _convert_blocks(
+    blocks: typing.Iterable[AudioBuffer],
+    sample_rate: int,
+    sample_width: int,
+    channels: int,
+) -> typing.Tuple[int, typing.Iterable[AudioBuffer]]:
+    """Convert blocks of PCM audio to 16-bit mono at a webrtcvad sample rate."""
+    out_rate = sample_rate if sample_rate in _VAD_SAMPLE_RATES else 16000
+    if (sample_width == 2) and (channels == 1) and (out_rate == sample_rate):
+        # No conversion needed
+        return out_rate, blocks
+
+    convert_stage = ConvertStage(
+        sample_rate=sample_rate,
+        sample_width=sample_width,
+        channels=channels,
+        out_rate=out_rate,
+    )
+
+    return out_rate, convert_stage.run(blocks)
+
+
 # -----------------------------------------------------------------------------
 
 if __name__ == "__main__":
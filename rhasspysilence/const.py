@@ -1,11 +1,30 @@
 """
 Data structures for voice command recording.
 """
+import array
+import math
 import typing
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
 
+# Audio data in any object supporting the buffer protocol (bytes, bytearray,
+# memoryview, array.array, numpy.ndarray, etc.)
+AudioBuffer = typing.Union[bytes, bytearray, memoryview]
+
+
+def _byte_view(audio_data: AudioBuffer) -> memoryview:
+    """Get a flat unsigned byte view of a buffer without copying (if possible)."""
+    audio_view = memoryview(audio_data)
+    if (audio_view.format == "B") and (audio_view.ndim == 1):
+        return audio_view
+
+    if audio_view.c_contiguous:
+        return audio_view.cast("B")
+
+    # Non-contiguous buffers (e.g., strided NumPy slices) have to be copied
+    return memoryview(audio_view.tobytes())
+
 
 class VoiceCommandResult(str, Enum):
     """Success/failure of voice command recognition."""
@@ -28,21 +47,95 @@ class VoiceCommandEventType(str, Enum):
 class VoiceCommandEvent:
     """Speech/silence events."""
 
+    __slots__ = ("type", "time", "sample")
+
     type: VoiceCommandEventType
     time: float
 
+    # Index of sample in audio stream since start()
+    sample: int
+
+
+@dataclass
+class FrameStats:
+    """Compact per-frame statistics of recorded audio.
+
+    Attributes
+    ----------
+    chunk_size: int
+        Size of each audio frame (bytes)
+
+    energies: array
+        Debiased energy of each frame (float32)
+
+    speech: bytearray
+        1 if frame was detected as speech, 0 otherwise
+    """
+
+    chunk_size: int
+    energies: "array.array[float]" = field(default_factory=lambda: array.array("f"))
+    speech: bytearray = field(default_factory=bytearray)
+
+
+@dataclass
+class AudioSegment:
+    """Sample offsets of a voice command in all audio given to the recorder.
+
+    Attributes
+    ----------
+    before_start: int
+        First sample of audio kept before voice command started
+
+    start: int
+        First sample after voice command started
+
+    end: int
+        Sample after the end of the voice command (exclusive)
+    """
+
+    before_start: int
+    start: int
+    end: int
+
 
 @dataclass
 class VoiceCommand:
     """Result of voice command recognition."""
 
     result: VoiceCommandResult
-    audio_data: typing.Optional[bytes] = None
+
+    # Memory-mapped view of a temporary file if audio was spilled to disk
+    audio_data: typing.Optional[AudioBuffer] = None
     events: typing.List[VoiceCommandEvent] = field(default_factory=list)
+    frame_stats: typing.Optional[FrameStats] = None
+    segment: typing.Optional[AudioSegment] = None
+
+    # Seconds before a fixed silence_seconds would have ended the voice command
+    # (adaptive_silence only, negative if extended)
+    latency_saved: typing.Optional[float] = None
 
 
 class VoiceCommandRecorder(ABC):
-    """Segment audio into voice command."""
+    """Segment audio into voice command.
+
+    process_chunk splits audio into frames of chunk_size bytes and passes each
+    one to process_frame.
+    """
+
+    __slots__ = ("current_chunk", "chunk_offset")
+
+    def __init__(self):
+        # Partial frame held until the next call
+        self.current_chunk: bytes = bytes()
+
+        # Bytes of the last chunk that were processed
+        self.chunk_offset: int = 0
+
+    @property
+    @abstractmethod
+    def chunk_size(self) -> int:
+        """Bytes per audio frame."""
+        pass
 
     @abstractmethod
     def start(self):
@@ -50,13 +143,59 @@ class VoiceCommandRecorder(ABC):
         pass
 
     @abstractmethod
-    def stop(self) -> bytes:
+    def stop(self) -> AudioBuffer:
         """Free any resources and return recorded audio."""
         pass
 
+    def process_chunk(self, audio_chunk: AudioBuffer) -> typing.Optional[VoiceCommand]:
+        """Process a single chunk of audio data.
+
+        Accepts any object supporting the buffer protocol. Whole frames are
+        analyzed in place; only a trailing partial frame is copied and held until
+        the next call. A frame is processed as soon as all of its bytes have
+        arrived.
+
+        When a voice command finishes before the end of the chunk, the rest of
+        the chunk is not kept, and chunk_offset is the number of bytes that were
+        processed. To find more voice commands in the same chunk, call
+        stop()/start() and pass memoryview(audio_chunk)[chunk_offset:].
+        """
+        chunk_size = self.chunk_size
+        audio_view = _byte_view(audio_chunk)
+        result: typing.Optional[VoiceCommand] = None
+        offset = 0
+
+        if self.current_chunk:
+            # Complete partial frame left over from last call
+            offset = min(len(audio_view), chunk_size - len(self.current_chunk))
+            self.current_chunk += audio_view[:offset]
+
+            if len(self.current_chunk) < chunk_size:
+                self.chunk_offset = offset
+                return None
+
+            leftover_chunk = self.current_chunk
+            self.current_chunk = bytes()
+            result = self.process_frame(leftover_chunk)
+
+        # Process audio in exact frame(s)
+        while (result is None) and ((offset + chunk_size) <= len(audio_view)):
+            chunk = audio_view[offset : offset + chunk_size]
+            offset += chunk_size
+            result = self.process_frame(chunk)
+
+        if result is None:
+            # Keep leftover partial frame
+            self.current_chunk = audio_view[offset:].tobytes()
+            offset = len(audio_view)
+
+        self.chunk_offset = offset
+
+        return result
+
     @abstractmethod
-    def process_chunk(self, audio_chunk: bytes) -> typing.Optional[VoiceCommand]:
-        """Process a single chunk of audio data."""
+    def process_frame(self, chunk: AudioBuffer) -> typing.Optional[VoiceCommand]:
+        """Process a single frame of exactly chunk_size bytes."""
         pass
 
 
@@ -90,3 +229,193 @@ class SilenceMethod(str, Enum):
     VAD_AND_RATIO = "vad_and_ratio"
     VAD_AND_CURRENT = "vad_and_current"
     ALL = "all"
+
+
+class PhraseOverflowPolicy(str, Enum):
+    """What to do with voice command audio beyond the phrase buffer limit.
+
+    Values
+    ------
+    TRUNCATE
+      Drop audio beyond the limit (keeps the start of the voice command)
+
+    SPILL
+      Write audio beyond the limit to a temporary file
+    """
+
+    TRUNCATE = "truncate"
+    SPILL = "spill"
+
+
+@dataclass(frozen=True)
+class RecorderConfig:
+    """Immutable settings of a WebRtcVadRecorder, shared between sessions.
+
+    Attributes match the keyword arguments of WebRtcVadRecorder. Frame counts
+    derived from them are computed once here instead of by every recorder.
+    """
+
+    vad_mode: int = 3
+    sample_rate: int = 16000
+    chunk_size: int = 960
+    skip_seconds: float = 0
+    min_seconds: float = 1
+    max_seconds: typing.Optional[float] = 30
+    speech_seconds: float = 0.3
+    silence_seconds: float = 0.5
+    before_seconds: float = 0.5
+    max_energy: typing.Optional[float] = None
+    max_current_ratio_threshold: typing.Optional[float] = None
+    current_energy_threshold: typing.Optional[float] = None
+    silence_method: SilenceMethod = SilenceMethod.VAD_ONLY
+    keep_frame_stats: bool = False
+    compute_energy: bool = False
+    max_events: typing.Optional[int] = None
+    max_phrase_bytes: typing.Optional[int] = None
+    phrase_overflow: PhraseOverflowPolicy = PhraseOverflowPolicy.TRUNCATE
+    reset_max_energy: bool = False
+    reset_vad: bool = False
+    keep_audio: bool = True
+    max_energy_seconds: typing.Optional[float] = None
+    max_energy_percentile: typing.Optional[float] = None
+    adaptive_vad_frames: typing.Optional[int] = None
+    adaptive_vad_max_error: float = 0.12
+    adaptive_vad_energy_ratio: float = 2.0
+    adaptive_silence: bool = False
+    adaptive_silence_min_seconds: float = 0.2
+    adaptive_silence_max_seconds: float = 1.0
+    adaptive_silence_pause_factor: float = 1.5
+    adaptive_silence_decay_ratio: float = 10.0
+
+    # Derived values
+    use_vad: bool = field(init=False)
+    use_ratio: bool = field(init=False)
+    use_current: bool = field(init=False)
+    dynamic_max_energy: bool = field(init=False)
+    seconds_per_buffer: float = field(init=False)
+    samples_per_buffer: int = field(init=False)
+    before_buffers: int = field(init=False)
+    speech_buffers: int = field(init=False)
+    skip_buffers: int = field(init=False)
+    min_seconds_buffers: int = field(init=False)
+    max_seconds_buffers: typing.Optional[int] = field(init=False)
+    silence_seconds_buffers: int = field(init=False)
+    max_energy_buffers: typing.Optional[int] = field(init=False)
+    adaptive_vad_interval: int = field(init=False)
+    adaptive_silence_min_buffers: int = field(init=False)
+    adaptive_silence_max_buffers: int = field(init=False)
+
+    def __post_init__(self):
+        # Verify settings
+        use_vad = self.silence_method in [
+            SilenceMethod.VAD_ONLY,
+            SilenceMethod.VAD_AND_RATIO,
+            SilenceMethod.VAD_AND_CURRENT,
+            SilenceMethod.ALL,
+        ]
+
+        use_ratio = self.silence_method in [
+            SilenceMethod.VAD_AND_RATIO,
+            SilenceMethod.RATIO_ONLY,
+            SilenceMethod.ALL,
+        ]
+
+        if use_ratio:
+            assert (
+                self.max_current_ratio_threshold is not None
+            ), "Max/current ratio threshold is required"
+
+        use_current = self.silence_method in [
+            SilenceMethod.VAD_AND_CURRENT,
+            SilenceMethod.CURRENT_ONLY,
+            SilenceMethod.ALL,
+        ]
+
+        if use_current:
+            assert (
+                self.current_energy_threshold is not None
+            ), "Current energy threshold is required"
+
+        if use_vad:
+            assert self.vad_mode in range(
+                1, 4
+            ), f"VAD mode must be 1-3 (got {self.vad_mode})"
+
+            chunk_ms = 1000 * ((self.chunk_size / 2) / self.sample_rate)
+            assert chunk_ms in [10, 20, 30], (
+                "Sample rate and chunk size must make for 10, 20, or 30 ms buffer sizes,"
+                + f" assuming 16-bit mono audio (got {chunk_ms} ms)"
+            )
+
+        if self.adaptive_vad_frames is not None:
+            assert (
+                self.adaptive_vad_frames > 0
+            ), f"Adaptive VAD frames must be positive (got {self.adaptive_vad_frames})"
+            assert (
+                self.adaptive_vad_max_error >= 0
+            ), f"Adaptive VAD max error must be >= 0 (got {self.adaptive_vad_max_error})"
+            assert (
+                self.adaptive_vad_energy_ratio > 1
+            ), f"Adaptive VAD energy ratio must be > 1 (got {self.adaptive_vad_energy_ratio})"
+
+        if self.adaptive_silence:
+            assert (
+                self.adaptive_silence_min_seconds <= self.adaptive_silence_max_seconds
+            ), (
+                "Adaptive silence min seconds must be <= max seconds "
+                + f"(got {self.adaptive_silence_min_seconds}, {self.adaptive_silence_max_seconds})"
+            )
+            assert (
+                self.adaptive_silence_pause_factor >= 1
+            ), f"Adaptive silence pause factor must be >= 1 (got {self.adaptive_silence_pause_factor})"
+            assert (
+                self.adaptive_silence_decay_ratio >= 1
+            ), f"Adaptive silence decay ratio must be >= 1 (got {self.adaptive_silence_decay_ratio})"
+
+        seconds_per_buffer = self.chunk_size / self.sample_rate
+
+        # Run webrtcvad every N frames during stable runs, so a missed transition
+        # is noticed within adaptive_vad_max_error seconds (same time scale as
+        # the other *_seconds settings).
+        adaptive_vad_interval = 1 + int(
+            math.floor((self.adaptive_vad_max_error / seconds_per_buffer) + 1e-9)
+        )
+
+        def num_buffers(seconds: float) -> int:
+            return int(math.ceil(seconds / seconds_per_buffer))
+
+        max_seconds_buffers: typing.Optional[int] = None
+        if self.max_seconds:
+            max_seconds_buffers = num_buffers(self.max_seconds)
+
+        max_energy_buffers: typing.Optional[int] = None
+        if self.max_energy_seconds is not None:
+            max_energy_buffers = max(1, num_buffers(self.max_energy_seconds))
+
+        # Frozen dataclass
+        derived = {
+            "use_vad": use_vad,
+            "use_ratio": use_ratio,
+            "use_current": use_current,
+            "dynamic_max_energy": self.max_energy is None,
+            "seconds_per_buffer": seconds_per_buffer,
+            # 16-bit mono audio
+            "samples_per_buffer": self.chunk_size // 2,
+            "before_buffers": num_buffers(self.before_seconds),
+            "speech_buffers": num_buffers(self.speech_seconds),
+            "skip_buffers": num_buffers(self.skip_seconds),
+            "min_seconds_buffers": num_buffers(self.min_seconds),
+            "max_seconds_buffers": max_seconds_buffers,
+            "silence_seconds_buffers": num_buffers(self.silence_seconds),
+            "max_energy_buffers": max_energy_buffers,
+            "adaptive_vad_interval": adaptive_vad_interval,
+            "adaptive_silence_min_buffers": num_buffers(
+                self.adaptive_silence_min_seconds
+            ),
+            "adaptive_silence_max_buffers": num_buffers(
+                self.adaptive_silence_max_seconds
+            ),
+        }
+
+        for name, value in derived.items():
+            object.__setattr__(self, name, value)
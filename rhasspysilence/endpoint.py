@@ -0,0 +1,153 @@
+"""Adaptive detection of the end of a voice command."""
+import math
+import typing
+from dataclasses import dataclass
+
+from .const import RecorderConfig
+
+# -----------------------------------------------------------------------------
+
+
+class UtteranceStats:
+    """Speech/pause statistics of the current voice command.
+
+    Used to decide how many frames of silence end the voice command instead of
+    a fixed silence_seconds.
+
+    Attributes
+    ----------
+    speech_run_frames: int
+        Frames in current (or most recent) run of speech
+
+    silence_run_frames: int
+        Frames in current run of silence (0 during speech)
+
+    max_pause_frames: int
+        Longest run of silence between two runs of speech
+
+    speech_frames: int
+        Total frames of speech
+
+    speech_energy: float
+        Total energy of speech frames
+
+    silence_energy: float
+        Total energy of frames in current run of silence
+
+    fixed_stop_sample: Optional[int]
+        Sample where a fixed silence_seconds would have ended the voice command
+    """
+
+    __slots__ = (
+        "speech_run_frames",
+        "silence_run_frames",
+        "max_pause_frames",
+        "speech_frames",
+        "speech_energy",
+        "silence_energy",
+        "fixed_stop_sample",
+    )
+
+    def __init__(self):
+        self.speech_run_frames: int = 0
+        self.silence_run_frames: int = 0
+        self.max_pause_frames: int = 0
+        self.speech_frames: int = 0
+        self.speech_energy: float = 0
+        self.silence_energy: float = 0
+        self.fixed_stop_sample: typing.Optional[int] = None
+
+    def add(self, is_speech: bool, energy: float):
+        """Add speech/silence decision and debiased energy of next frame."""
+        if is_speech:
+            if self.silence_run_frames > 0:
+                # Pause between words
+                if self.speech_frames > 0:
+                    self.max_pause_frames = max(
+                        self.max_pause_frames, self.silence_run_frames
+                    )
+
+                self.silence_run_frames = 0
+                self.speech_run_frames = 0
+
+            self.speech_run_frames += 1
+            self.speech_frames += 1
+            self.speech_energy += energy
+        else:
+            if self.silence_run_frames == 0:
+                self.silence_energy = 0
+
+            self.silence_run_frames += 1
+            self.silence_energy += energy
+
+    def get_silence_buffers(self, config: RecorderConfig) -> int:
+        """Frames of silence that end the voice command.
+
+        Waits longer than the longest pause between words so far, but at least
+        the fixed silence_seconds if energy has not decayed from speech or the
+        last run of speech was too short to be sure it was a word.
+        """
+        if self.max_pause_frames > 0:
+            num_buffers = int(
+                math.ceil(self.max_pause_frames * config.adaptive_silence_pause_factor)
+            )
+        else:
+            num_buffers = config.adaptive_silence_min_buffers
+
+        energy_decayed = False
+        if (self.speech_frames > 0) and (self.silence_run_frames > 0):
+            mean_speech_energy = self.speech_energy / self.speech_frames
+            mean_silence_energy = self.silence_energy / self.silence_run_frames
+            energy_decayed = (
+                mean_silence_energy * config.adaptive_silence_decay_ratio
+            ) <= mean_speech_energy
+
+        if (not energy_decayed) or (self.speech_run_frames < config.speech_buffers):
+            num_buffers = max(num_buffers, config.silence_seconds_buffers)
+
+        return min(
+            config.adaptive_silence_max_buffers,
+            max(config.adaptive_silence_min_buffers, num_buffers),
+        )
+
+
+@dataclass
+class EndpointStats:
+    """Accumulated latency saved by adaptive endpointing.
+
+    Latency saved is estimated against a fixed silence_seconds, assuming silence
+    would have continued. It is negative when the voice command was extended.
+    Minimum and maximum are None until the first voice command.
+    """
+
+    commands: int = 0
+    early: int = 0
+    late: int = 0
+    total_saved_seconds: float = 0
+    max_saved_seconds: typing.Optional[float] = None
+    min_saved_seconds: typing.Optional[float] = None
+
+    def add(self, saved_seconds: float):
+        """Accumulate latency saved for a single voice command."""
+        self.commands += 1
+        if saved_seconds > 0:
+            self.early += 1
+        elif saved_seconds < 0:
+            self.late += 1
+
+        self.total_saved_seconds += saved_seconds
+        if (self.max_saved_seconds is None) or (saved_seconds > self.max_saved_seconds):
+            self.max_saved_seconds = saved_seconds
+
+        if (self.min_saved_seconds is None) or (saved_seconds < self.min_saved_seconds):
+            self.min_saved_seconds = saved_seconds
+
+    @property
+    def mean_saved_seconds(self) -> float:
+        """Mean latency saved per voice command (seconds)."""
+        return self.total_saved_seconds / self.commands if self.commands else 0
+
+    @property
+    def early_ratio(self) -> float:
+        """Fraction of voice commands that ended before fixed silence_seconds."""
+        return self.early / self.commands if self.commands else 0
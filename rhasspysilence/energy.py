@@ -0,0 +1,192 @@
+"""Reference energy tracking for max/current energy ratio."""
+import math
+import typing
+from abc import ABC, abstractmethod
+from collections import deque
+
+# -----------------------------------------------------------------------------
+
+
+class EnergyTracker(ABC):
+    """Tracks a reference energy value from observed audio frames."""
+
+    @abstractmethod
+    def add(self, energy: float) -> float:
+        """Add energy of next frame and return updated reference energy."""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Forget all observed energies."""
+        pass
+
+
+class WindowMaxEnergy(EnergyTracker):
+    """Maximum energy over the last N frames.
+
+    Uses a monotonic deque, so updates are O(1) amortized and memory is bounded by
+    the window size.
+
+    Attributes
+    ----------
+    window_frames: Optional[int] = None
+        Number of frames in window (None for all frames)
+    """
+
+    def __init__(self, window_frames: typing.Optional[int] = None):
+        self.window_frames = window_frames
+        self.max_energy: typing.Optional[float] = None
+
+        # (frame index, energy) with decreasing energies
+        self.candidates: typing.Deque[typing.Tuple[int, float]] = deque()
+        self.frame_index: int = 0
+
+    def add(self, energy: float) -> float:
+        """Add energy of next frame and return maximum energy in window."""
+        if self.window_frames is None:
+            # Running maximum
+            if (self.max_energy is None) or (energy > self.max_energy):
+                self.max_energy = energy
+
+            return self.max_energy
+
+        # Drop candidates that can never be the maximum again
+        while self.candidates and (self.candidates[-1][1] <= energy):
+            self.candidates.pop()
+
+        self.candidates.append((self.frame_index, energy))
+
+        # Drop candidates outside window
+        while self.candidates[0][0] <= (self.frame_index - self.window_frames):
+            self.candidates.popleft()
+
+        self.frame_index += 1
+        self.max_energy = self.candidates[0][1]
+
+        return self.max_energy
+
+    def clear(self):
+        """Forget all observed energies."""
+        self.max_energy = None
+        self.candidates.clear()
+        self.frame_index = 0
+
+
+class WindowQuantileEnergy(EnergyTracker):
+    """Approximate quantile of energy over the last N frames.
+
+    Energies are counted in logarithmically-spaced bins, so the returned value is
+    within relative_accuracy of the true quantile. Memory is a fixed number of
+    bins plus one byte per frame in the window.
+
+    Attributes
+    ----------
+    quantile: float
+        Quantile to track (0-1)
+
+    window_frames: Optional[int] = None
+        Number of frames in window (None for all frames)
+
+    relative_accuracy: float = 0.05
+        Maximum relative error of returned energy
+
+    max_energy: float = 32768
+        Largest energy value that will be observed (16-bit audio)
+    """
+
+    def __init__(
+        self,
+        quantile: float,
+        window_frames: typing.Optional[int] = None,
+        relative_accuracy: float = 0.05,
+        max_energy: float = 32768,
+    ):
+        assert 0 <= quantile <= 1, f"Quantile must be 0-1 (got {quantile})"
+        assert (
+            0 < relative_accuracy < 1
+        ), f"Relative accuracy must be in (0, 1) (got {relative_accuracy})"
+
+        self.quantile = quantile
+        self.window_frames = window_frames
+
+        # Bin 0 holds energies below 1, bin i >= 1 holds [gamma^(i-1), gamma^i)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.num_bins = 2 + int(
+            math.ceil(math.log(max(1, max_energy)) / self.log_gamma)
+        )
+        assert self.num_bins <= 256, "Too many bins (increase relative accuracy)"
+
+        self.counts: typing.List[int] = [0] * self.num_bins
+        self.num_energies: int = 0
+
+        # Bin index of each frame in window (ring buffer)
+        self.window_bins = bytearray(window_frames or 0)
+        self.frame_index: int = 0
+
+    def add(self, energy: float) -> float:
+        """Add energy of next frame and return approximate quantile in window."""
+        bin_index = self._get_bin(energy)
+
+        if self.window_frames is not None:
+            ring_index = self.frame_index % self.window_frames
+            if self.frame_index >= self.window_frames:
+                # Remove frame leaving window
+                self.counts[self.window_bins[ring_index]] -= 1
+                self.num_energies -= 1
+
+            self.window_bins[ring_index] = bin_index
+
+        self.counts[bin_index] += 1
+        self.num_energies += 1
+        self.frame_index += 1
+
+        return self.get_value()
+
+    def get_value(self) -> float:
+        """Approximate quantile of energies in window."""
+        if self.num_energies < 1:
+            return 0
+
+        rank = int(self.quantile * (self.num_energies - 1))
+        cumulative_count = 0
+        for bin_index, count in enumerate(self.counts):
+            cumulative_count += count
+            if cumulative_count > rank:
+                return self._get_bin_value(bin_index)
+
+        return self._get_bin_value(self.num_bins - 1)
+
+    def clear(self):
+        """Forget all observed energies."""
+        self.counts = [0] * self.num_bins
+        self.num_energies = 0
+        self.frame_index = 0
+
+    def _get_bin(self, energy: float) -> int:
+        if energy < 1:
+            return 0
+
+        bin_index = 1 + int(math.floor(math.log(energy) / self.log_gamma))
+        return min(bin_index, self.num_bins - 1)
+
+    def _get_bin_value(self, bin_index: int) -> float:
+        if bin_index < 1:
+            return 0
+
+        # Value with equal relative distance to both bin edges
+        return 2 * (self.gamma**bin_index) / (self.gamma + 1)
+
+
+# -----------------------------------------------------------------------------
+
+
+def get_energy_tracker(
+    window_frames: typing.Optional[int] = None,
+    percentile: typing.Optional[float] = None,
+) -> EnergyTracker:
+    """Create tracker for max energy (or percentile 0-100) over a window of frames."""
+    if percentile is None:
+        return WindowMaxEnergy(window_frames=window_frames)
+
+    return WindowQuantileEnergy(quantile=percentile / 100, window_frames=window_frames)
@@ -0,0 +1,594 @@
+"""Composable streaming stages around voice command recording.
+
+A pipeline is a sequence of stages. Each stage turns an iterable of input items
+into an iterable of output items, and may run inline (in the consumer's
+thread), on its own thread, or in its own process. Stages that do not run
+inline are connected by bounded queues.
+"""
+import audioop
+import dataclasses
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import typing
+import wave
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+
+from . import WebRtcVadRecorder, _byte_view
+from .const import AudioBuffer, VoiceCommand
+from .utils import trim_command, trim_silence
+
+_LOGGER = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+
+
+class StageMode(str, Enum):
+    """Where a stage runs."""
+
+    INLINE = "inline"
+    THREAD = "thread"
+    PROCESS = "process"
+
+
+@dataclass
+class StageStats:
+    """Throughput and queue statistics of a stage.
+
+    Attributes
+    ----------
+    items_in: int
+        Number of items processed
+
+    items_out: int
+        Number of items produced
+
+    busy_seconds: float
+        Seconds spent processing items (excluding waiting on queues)
+
+    queue_depth: int
+        Number of output items waiting in queue (last observed)
+
+    max_queue_depth: int
+        Largest observed number of output items waiting in queue
+    """
+
+    items_in: int = 0
+    items_out: int = 0
+    busy_seconds: float = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Items processed per busy second."""
+        return self.items_in / self.busy_seconds if self.busy_seconds > 0 else 0
+
+    def update_queue_depth(self, item_queue: typing.Any):
+        """Sample the number of items in a queue."""
+        try:
+            self.queue_depth = item_queue.qsize()
+        except NotImplementedError:
+            # Not available for multiprocessing queues on macOS
+            return
+
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+
+class Stage(ABC):
+    """Streaming stage that produces zero or more output items per input item.
+
+    Attributes
+    ----------
+    name: Optional[str] = None
+        Name used in statistics (default: class name)
+
+    mode: StageMode = "inline"
+        Run stage inline, on a thread, or in a separate process
+
+    queue_size: int = 16
+        Maximum number of output items waiting in queue (thread/process only)
+    """
+
+    def __init__(
+        self,
+        name: typing.Optional[str] = None,
+        mode: StageMode = StageMode.INLINE,
+        queue_size: int = 16,
+    ):
+        self.name = name or self.__class__.__name__
+        self.mode = mode
+        self.queue_size = queue_size
+        self.stats = StageStats()
+
+    def start(self):
+        """Called before the first item."""
+        pass
+
+    @abstractmethod
+    def process(self, item: typing.Any) -> typing.Iterable[typing.Any]:
+        """Process a single item."""
+        pass
+
+    def finish(self) -> typing.Iterable[typing.Any]:
+        """Called after the last item. May produce final output items."""
+        return ()
+
+    def run(self, items: typing.Iterable[typing.Any]) -> typing.Iterator[typing.Any]:
+        """Process all items, keeping statistics."""
+        start_time = time.perf_counter()
+        self.start()
+        self.stats.busy_seconds += time.perf_counter() - start_time
+
+        for item in items:
+            self.stats.items_in += 1
+            start_time = time.perf_counter()
+            outputs = list(self.process(item))
+            self.stats.busy_seconds += time.perf_counter() - start_time
+
+            self.stats.items_out += len(outputs)
+            yield from outputs
+
+        start_time = time.perf_counter()
+        outputs = list(self.finish())
+        self.stats.busy_seconds += time.perf_counter() - start_time
+
+        self.stats.items_out += len(outputs)
+        yield from outputs
+
+
+class MapStage(Stage):
+    """Apply a function to each item, dropping None results."""
+
+    def __init__(
+        self, function: typing.Callable[[typing.Any], typing.Any], **kwargs: typing.Any
+    ):
+        kwargs.setdefault("name", getattr(function, "__name__", None))
+        super().__init__(**kwargs)
+        self.function = function
+
+    def process(self, item: typing.Any) -> typing.Iterable[typing.Any]:
+        """Apply function to item."""
+        output = self.function(item)
+        if output is not None:
+            yield output
+
+
+# -----------------------------------------------------------------------------
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues where needed.
+
+    Attributes
+    ----------
+    stages: List[Stage]
+        Stages in order
+    """
+
+    def __init__(self, stages: typing.Iterable[Stage]):
+        self.stages = list(stages)
+
+    @property
+    def stats(self) -> typing.Dict[str, StageStats]:
+        """Statistics of each stage by name."""
+        return {stage.name: stage.stats for stage in self.stages}
+
+    def run(self, items: typing.Iterable[typing.Any]) -> typing.Iterator[typing.Any]:
+        """Stream items through all stages.
+
+        Worker threads/processes are stopped when the returned iterator is
+        exhausted or closed.
+        """
+        stop_event = threading.Event()
+        workers: typing.List[typing.Any] = []
+        stream: typing.Iterable[typing.Any] = items
+
+        for stage in self.stages:
+            if stage.mode == StageMode.THREAD:
+                stream = _run_thread(stage, stream, stop_event, workers)
+            elif stage.mode == StageMode.PROCESS:
+                stream = _run_process(stage, stream, stop_event, workers)
+            else:
+                stream = stage.run(stream)
+
+        try:
+            yield from stream
+        finally:
+            stop_event.set()
+            for worker in workers:
+                if isinstance(worker, multiprocessing.Process):
+                    if worker.is_alive():
+                        worker.terminate()
+
+                    worker.join()
+                else:
+                    # Threads may be blocked reading upstream items (e.g., stdin)
+                    worker.join(timeout=1)
+
+
+# -----------------------------------------------------------------------------
+
+_ITEM = "item"
+_DONE = "done"
+_ERROR = "error"
+
+
+def _put(
+    item_queue: typing.Any,
+    message: typing.Tuple[str, typing.Any],
+    stop_event: threading.Event,
+) -> bool:
+    """Put message in bounded queue, giving up when stopped."""
+    while not stop_event.is_set():
+        try:
+            item_queue.put(message, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _run_thread(
+    stage: Stage,
+    items: typing.Iterable[typing.Any],
+    stop_event: threading.Event,
+    workers: typing.List[typing.Any],
+) -> typing.Iterator[typing.Any]:
+    """Run stage on a thread, yielding its outputs."""
+    output_queue: "queue.Queue[typing.Tuple[str, typing.Any]]" = queue.Queue(
+        maxsize=stage.queue_size
+    )
+
+    def worker():
+        # Consumer waits for DONE or ERROR, so one is always sent
+        message: typing.Tuple[str, typing.Any] = (_DONE, None)
+        try:
+            for output in stage.run(items):
+                if not _put(output_queue, (_ITEM, output), stop_event):
+                    return
+
+                stage.stats.update_queue_depth(output_queue)
+        except BaseException as e:  # pylint: disable=broad-except
+            message = (_ERROR, e)
+        finally:
+            _put(output_queue, message, stop_event)
+
+    thread = threading.Thread(target=worker, name=stage.name, daemon=True)
+    workers.append(thread)
+    thread.start()
+
+    while True:
+        message_type, value = output_queue.get()
+        if message_type == _DONE:
+            break
+
+        if message_type == _ERROR:
+            raise value
+
+        yield value
+
+
+def _picklable(item: typing.Any) -> typing.Any:
+    """Copy memoryviews (including spilled voice command audio) to bytes."""
+    if isinstance(item, memoryview):
+        return item.tobytes()
+
+    if isinstance(item, VoiceCommand) and isinstance(item.audio_data, memoryview):
+        return dataclasses.replace(item, audio_data=item.audio_data.tobytes())
+
+    return item
+
+
+def _process_worker(
+    stage: Stage,
+    input_queue: typing.Any,
+    output_queue: typing.Any,
+):
+    """Body of stage process."""
+    stop_event = threading.Event()
+
+    def read_items():
+        while True:
+            message_type, value = input_queue.get()
+            if message_type == _DONE:
+                break
+
+            yield value
+
+    try:
+        for output in stage.run(read_items()):
+            _put(output_queue, (_ITEM, _picklable(output)), stop_event)
+            stage.stats.update_queue_depth(output_queue)
+
+        # Statistics are sent back to parent process
+        _put(output_queue, (_DONE, stage.stats), stop_event)
+    except Exception as e:
+        _put(output_queue, (_ERROR, e), stop_event)
+
+
+def _run_process(
+    stage: Stage,
+    items: typing.Iterable[typing.Any],
+    stop_event: threading.Event,
+    workers: typing.List[typing.Any],
+) -> typing.Iterator[typing.Any]:
+    """Run stage in a separate process, yielding its outputs.
+
+    Stage and items must be picklable (memoryviews are sent as bytes).
+    """
+    input_queue: typing.Any = multiprocessing.Queue(maxsize=stage.queue_size)
+    output_queue: typing.Any = multiprocessing.Queue(maxsize=stage.queue_size)
+
+    process = multiprocessing.Process(
+        target=_process_worker,
+        args=(stage, input_queue, output_queue),
+        name=stage.name,
+        daemon=True,
+    )
+    workers.append(process)
+    process.start()
+
+    def feed():
+        for item in items:
+            if not _put(input_queue, (_ITEM, _picklable(item)), stop_event):
+                return
+
+        _put(input_queue, (_DONE, None), stop_event)
+
+    feed_thread = threading.Thread(target=feed, name=f"{stage.name}-feed", daemon=True)
+    workers.append(feed_thread)
+    feed_thread.start()
+
+    while True:
+        message: typing.Optional[typing.Tuple[str, typing.Any]] = None
+        try:
+            message = output_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+        if message is None:
+            if not process.is_alive():
+                raise RuntimeError(f"Stage process {stage.name} exited unexpectedly")
+
+            continue
+
+        message_type, value = message
+
+        if message_type == _DONE:
+            stage.stats = value
+            break
+
+        if message_type == _ERROR:
+            raise value
+
+        yield value
+
+
+# -----------------------------------------------------------------------------
+
+
+class ConvertStage(Stage):
+    """Convert blocks of PCM audio to 16-bit mono at a new sample rate.
+
+    Attributes
+    ----------
+    sample_rate: int
+        Sample rate of input audio (hertz)
+
+    sample_width: int
+        Bytes per input sample (1 = unsigned 8-bit)
+
+    channels: int
+        Number of input channels (1 or 2)
+
+    out_rate: Optional[int] = None
+        Sample rate of output audio (None for input rate)
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+        out_rate: typing.Optional[int] = None,
+        **kwargs: typing.Any,
+    ):
+        super().__init__(**kwargs)
+        assert channels in [
+            1,
+            2,
+        ], f"Only mono or stereo audio is supported (got {channels})"
+
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.out_rate = out_rate or sample_rate
+        self.rate_state: typing.Any = None
+
+    def start(self):
+        """Reset resampling state."""
+        self.rate_state = None
+
+    def process(self, item: AudioBuffer) -> typing.Iterable[AudioBuffer]:
+        """Convert a block of audio."""
+        block = item
+        if self.sample_width == 1:
+            # 8-bit WAV audio is unsigned
+            block = audioop.bias(block, 1, -128)
+
+        if self.sample_width != 2:
+            block = audioop.lin2lin(block, self.sample_width, 2)
+
+        if self.channels == 2:
+            block = audioop.tomono(block, 2, 0.5, 0.5)
+
+        if self.out_rate != self.sample_rate:
+            block, self.rate_state = audioop.ratecv(
+                block, 2, 1, self.sample_rate, self.out_rate, self.rate_state
+            )
+
+        yield block
+
+
+class RecorderStage(Stage):
+    """Segment audio chunks into voice commands.
+
+    Each voice command's audio_data is the audio returned by recorder.stop(), so
+    timed out commands include their audio as well.
+
+    Attributes
+    ----------
+    recorder: WebRtcVadRecorder
+        Recorder used to segment audio
+
+    chunk_callback: Optional[Callable[[WebRtcVadRecorder, AudioBuffer], None]]
+        Called after each chunk is processed (e.g., to inspect events)
+    """
+
+    def __init__(
+        self,
+        recorder: WebRtcVadRecorder,
+        chunk_callback: typing.Optional[
+            typing.Callable[[WebRtcVadRecorder, AudioBuffer], None]
+        ] = None,
+        **kwargs: typing.Any,
+    ):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+        self.chunk_callback = chunk_callback
+
+    def start(self):
+        """Begin first voice command."""
+        self.recorder.start()
+
+    def process(self, item: AudioBuffer) -> typing.Iterable[VoiceCommand]:
+        """Process a single chunk of audio data."""
+        audio_view = _byte_view(item)
+        while audio_view:
+            command = self.recorder.process_chunk(audio_view)
+
+            if self.chunk_callback is not None:
+                self.chunk_callback(self.recorder, audio_view)
+
+            if command is None:
+                break
+
+            # More voice commands may follow in the same chunk
+            audio_view = audio_view[self.recorder.chunk_offset :]
+
+            # Reset after voice command
+            audio_data = self.recorder.stop()
+            self.recorder.start()
+
+            if command.audio_data is None:
+                # Audio was not kept (keep_audio=False)
+                yield command
+            else:
+                yield dataclasses.replace(command, audio_data=audio_data)
+
+
+class TrimStage(Stage):
+    """Trim silence from voice commands.
+
+    Frame statistics are re-used when the recorder kept them with a matching
+    chunk size; otherwise energies are computed with trim_silence. Voice
+    commands without audio (keep_audio=False) only have their segment trimmed,
+    which requires frame statistics; otherwise they are passed through.
+    """
+
+    def __init__(
+        self,
+        ratio_threshold: float = 20.0,
+        chunk_size: int = 960,
+        keep_chunks_before: int = 0,
+        keep_chunks_after: int = 0,
+        **kwargs: typing.Any,
+    ):
+        super().__init__(**kwargs)
+        self.ratio_threshold = ratio_threshold
+        self.chunk_size = chunk_size
+        self.keep_chunks_before = keep_chunks_before
+        self.keep_chunks_after = keep_chunks_after
+
+    def process(self, item: VoiceCommand) -> typing.Iterable[VoiceCommand]:
+        """Trim a single voice command."""
+        if item.frame_stats and (item.frame_stats.chunk_size == self.chunk_size):
+            # Energies were already computed during recording
+            yield trim_command(
+                item,
+                ratio_threshold=self.ratio_threshold,
+                keep_chunks_before=self.keep_chunks_before,
+                keep_chunks_after=self.keep_chunks_after,
+            )
+            return
+
+        if item.audio_data is None:
+            # Nothing to trim
+            yield item
+            return
+
+        yield dataclasses.replace(
+            item,
+            audio_data=trim_silence(
+                item.audio_data,
+                chunk_size=self.chunk_size,
+                ratio_threshold=self.ratio_threshold,
+                keep_chunks_before=self.keep_chunks_before,
+                keep_chunks_after=self.keep_chunks_after,
+            ),
+            segment=None,
+        )
+
+
+class WavWriterStage(Stage):
+    """Write audio of each voice command to a numbered WAV file.
+
+    Attributes
+    ----------
+    wav_dir: Path
+        Directory to write WAV files to
+
+    name_format: str = "{}.wav"
+        Format for file names (with index)
+
+    sample_rate: int = 16000
+        Sample rate of audio (hertz)
+
+    wav_index: int = 0
+        Index of next WAV file
+    """
+
+    def __init__(
+        self,
+        wav_dir: typing.Union[str, Path],
+        name_format: str = "{}.wav",
+        sample_rate: int = 16000,
+        wav_index: int = 0,
+        **kwargs: typing.Any,
+    ):
+        super().__init__(**kwargs)
+        self.wav_dir = Path(wav_dir)
+        self.name_format = name_format
+        self.sample_rate = sample_rate
+        self.wav_index = wav_index
+
+    def process(self, item: VoiceCommand) -> typing.Iterable[Path]:
+        """Write voice command to a WAV file and output its path."""
+        wav_path = self.wav_dir / self.name_format.format(self.wav_index)
+
+        wav_file: wave.Wave_write = wave.open(str(wav_path), "wb")
+        with wav_file:
+            wav_file.setframerate(self.sample_rate)
+            wav_file.setsampwidth(2)
+            wav_file.setnchannels(1)
+            wav_file.writeframes(item.audio_data or bytes())
+
+        self.wav_index += 1
+        yield wav_path
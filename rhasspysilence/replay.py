@@ -0,0 +1,192 @@
+"""Replay a recorder trace to check decisions and measure per-frame cost.
+
+Usage: python3 -m rhasspysilence.replay [--real-time] TRACE
+"""
+import argparse
+import logging
+import math
+import sys
+import time
+import typing
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import WebRtcVadRecorder
+from .trace import TraceReader, TraceRecordType
+
+_LOGGER = logging.getLogger("rhasspysilence.replay")
+
+# -----------------------------------------------------------------------------
+
+
+@dataclass
+class ReplayStats:
+    """Result of replaying a trace.
+
+    Attributes
+    ----------
+    frames: int
+        Number of frames replayed
+
+    commands: int
+        Number of voice commands finished during replay
+
+    mismatches: int
+        Number of frames whose decision differed from the trace
+
+    first_mismatch: Optional[int]
+        Index of first frame whose decision differed (None if all matched)
+
+    energy_mismatches: int
+        Number of frames whose re-computed energy differed from the trace
+
+    traced_ns: array
+        Nanoseconds each frame took when traced
+
+    replay_ns: array
+        Nanoseconds each frame took during replay
+    """
+
+    frames: int = 0
+    commands: int = 0
+    mismatches: int = 0
+    first_mismatch: typing.Optional[int] = None
+    energy_mismatches: int = 0
+    traced_ns: "array[int]" = field(default_factory=lambda: array("q"))
+    replay_ns: "array[int]" = field(default_factory=lambda: array("q"))
+
+
+def get_percentile(values: typing.Sequence[int], percentile: float) -> int:
+    """Get percentile (0-100) of values (nearest rank)."""
+    if not values:
+        return 0
+
+    sorted_values = sorted(values)
+    index = int(round((percentile / 100) * (len(sorted_values) - 1)))
+
+    return sorted_values[index]
+
+
+def replay_trace(
+    trace_path: typing.Union[str, Path], real_time: bool = False
+) -> ReplayStats:
+    """Drive recorder(s) with frames from a trace and compare decisions.
+
+    Frames are replayed as fast as possible, or at their traced times if
+    real_time is True. Debiased energy is re-computed for frames whose energy
+    was traced, and compared with the traced value.
+    """
+    stats = ReplayStats()
+    recorder: typing.Optional[WebRtcVadRecorder] = None
+    replay_start_ns = time.perf_counter_ns()
+
+    with TraceReader(trace_path) as reader:
+        for record in reader:
+            if record.type == TraceRecordType.CONFIG:
+                assert record.config is not None
+                recorder = WebRtcVadRecorder(config=record.config)
+
+                # Traced times restart with each writer (e.g., appended sessions)
+                replay_start_ns = time.perf_counter_ns() - record.time_ns
+                continue
+
+            if real_time:
+                # Wait until traced time
+                wait_ns = record.time_ns - (time.perf_counter_ns() - replay_start_ns)
+                if wait_ns > 0:
+                    time.sleep(wait_ns / 1e9)
+
+            assert recorder is not None, "Record before config"
+            if record.type == TraceRecordType.START:
+                recorder.start()
+            elif record.type == TraceRecordType.STOP:
+                recorder.stop()
+            elif record.type == TraceRecordType.FRAME:
+                assert record.frame is not None
+                skipped = recorder.skip_buffers_left > 0
+
+                start_ns = time.perf_counter_ns()
+                energy: typing.Optional[float] = None
+                if (record.energy is not None) and (not skipped):
+                    # Same work as when traced
+                    energy = WebRtcVadRecorder.get_debiased_energy(record.frame)
+
+                command = recorder.process_frame(record.frame, energy=energy)
+                stats.replay_ns.append(time.perf_counter_ns() - start_ns)
+                stats.traced_ns.append(record.duration_ns)
+
+                if (energy is not None) and (record.energy is not None):
+                    # Traced energy is single precision
+                    if not math.isclose(energy, record.energy, rel_tol=1e-6):
+                        stats.energy_mismatches += 1
+
+                if command is not None:
+                    stats.commands += 1
+
+                if (
+                    (skipped != record.skipped)
+                    or (recorder.last_speech != record.is_speech)
+                    or ((command is not None) != record.command)
+                ):
+                    stats.mismatches += 1
+                    if stats.first_mismatch is None:
+                        stats.first_mismatch = stats.frames
+
+                stats.frames += 1
+
+    return stats
+
+
+# -----------------------------------------------------------------------------
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(prog="rhasspy-silence-replay")
+    parser.add_argument("trace", help="Path to trace file")
+    parser.add_argument(
+        "--real-time",
+        action="store_true",
+        help="Replay frames at their traced times instead of as fast as possible",
+    )
+    parser.add_argument(
+        "--debug", action="store_true", help="Print DEBUG messages to the console"
+    )
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    _LOGGER.debug(args)
+
+    stats = replay_trace(args.trace, real_time=args.real_time)
+
+    print("Frames:", stats.frames)
+    print("Voice commands:", stats.commands)
+    print("Mismatched decisions:", stats.mismatches, end="")
+    if stats.first_mismatch is not None:
+        print(f" (first at frame {stats.first_mismatch})", end="")
+
+    print("")
+    print("Mismatched energies:", stats.energy_mismatches)
+
+    for name, frame_ns in [("Traced", stats.traced_ns), ("Replay", stats.replay_ns)]:
+        mean_us = (sum(frame_ns) / len(frame_ns)) / 1000 if frame_ns else 0
+        print(
+            f"{name} cost per frame (us): mean {mean_us:.2f},",
+            f"p50 {get_percentile(frame_ns, 50) / 1000:.2f},",
+            f"p99 {get_percentile(frame_ns, 99) / 1000:.2f},",
+            f"max {max(frame_ns, default=0) / 1000:.2f}",
+        )
+
+    if (stats.mismatches > 0) or (stats.energy_mismatches > 0):
+        sys.exit(1)
+
+
+# -----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""Shadow evaluation of multiple recorder configurations on one audio stream."""
+import logging
+import typing
+from collections import deque
+from dataclasses import dataclass, field
+
+import webrtcvad
+
+from . import WebRtcVadRecorder
+from .const import (
+    AudioBuffer,
+    VoiceCommand,
+    VoiceCommandEvent,
+    VoiceCommandEventType,
+    VoiceCommandRecorder,
+    VoiceCommandResult,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+
+
+@dataclass
+class ShadowDivergence:
+    """Difference between a shadow and the primary configuration for one command.
+
+    Attributes
+    ----------
+    name: str
+        Name of shadow configuration
+
+    primary_result: Optional[VoiceCommandResult]
+        Result of primary configuration (None if not finished)
+
+    shadow_result: Optional[VoiceCommandResult]
+        Result of shadow configuration (None if not finished)
+
+    start_delta: Optional[float]
+        Seconds shadow started after primary (None if either did not start)
+
+    end_delta: Optional[float]
+        Seconds shadow finished after primary (None if either did not finish)
+    """
+
+    name: str
+    primary_result: typing.Optional[VoiceCommandResult] = None
+    shadow_result: typing.Optional[VoiceCommandResult] = None
+    start_delta: typing.Optional[float] = None
+    end_delta: typing.Optional[float] = None
+
+
+@dataclass
+class ShadowStats:
+    """Accumulated divergence of a shadow configuration."""
+
+    commands: int = 0
+    result_mismatches: int = 0
+    start_count: int = 0
+    end_count: int = 0
+    total_start_delta: float = 0
+    total_end_delta: float = 0
+    max_start_delta: float = 0
+    max_end_delta: float = 0
+
+    def add(self, divergence: ShadowDivergence):
+        """Accumulate divergence from a single voice command."""
+        self.commands += 1
+        if divergence.primary_result != divergence.shadow_result:
+            self.result_mismatches += 1
+
+        if divergence.start_delta is not None:
+            start_delta = abs(divergence.start_delta)
+            self.start_count += 1
+            self.total_start_delta += start_delta
+            self.max_start_delta = max(self.max_start_delta, start_delta)
+
+        if divergence.end_delta is not None:
+            end_delta = abs(divergence.end_delta)
+            self.end_count += 1
+            self.total_end_delta += end_delta
+            self.max_end_delta = max(self.max_end_delta, end_delta)
+
+    @property
+    def mean_start_delta(self) -> float:
+        """Mean absolute difference in start time (seconds)."""
+        return self.total_start_delta / self.start_count if self.start_count else 0
+
+    @property
+    def mean_end_delta(self) -> float:
+        """Mean absolute difference in end time (seconds)."""
+        return self.total_end_delta / self.end_count if self.end_count else 0
+
+
+# Result, start time, and end time (seconds from start of audio stream)
+_Boundaries = typing.Tuple[
+    typing.Optional[VoiceCommandResult], typing.Optional[float], typing.Optional[float]
+]
+
+
+@dataclass
+class _Comparison:
+    """Primary and shadow voice commands compared for one primary voice command."""
+
+    # Set when primary is stopped
+    primary: typing.Optional[_Boundaries] = None
+    shadows: typing.Dict[str, _Boundaries] = field(default_factory=dict)
+    commands: typing.Dict[str, VoiceCommand] = field(default_factory=dict)
+
+    # Shadows that have not finished yet
+    waiting: typing.Set[str] = field(default_factory=set)
+
+
+# -----------------------------------------------------------------------------
+
+
+class _VadGroup:
+    """webrtcvad detector shared by recorders that fed it the same frames.
+
+    The leader runs the detector and its result for the current frame is
+    reused by the followers. A follower that does not analyze the same frames
+    as the leader leaves the group and continues with a detector of its own.
+    """
+
+    __slots__ = ("vad", "leader", "followers", "speech", "followers_fed")
+
+    def __init__(self, leader: WebRtcVadRecorder):
+        self.vad = webrtcvad.Vad(leader.config.vad_mode)
+        self.leader = leader
+        self.followers: typing.Set[WebRtcVadRecorder] = set()
+
+        # Leader result for the current frame (None if not analyzed)
+        self.speech: typing.Optional[bool] = None
+        self.followers_fed: typing.Set[WebRtcVadRecorder] = set()
+
+        leader.vad = _SharedVad(self, leader)
+
+    def add(self, follower: WebRtcVadRecorder):
+        """Share detector with a recorder."""
+        self.followers.add(follower)
+        follower.vad = _SharedVad(self, follower)
+
+    def leave(self, follower: WebRtcVadRecorder) -> typing.Any:
+        """Give a follower its own detector."""
+        self.followers.discard(follower)
+        if isinstance(follower.vad, _SharedVad):
+            follower.vad = webrtcvad.Vad(follower.config.vad_mode)
+
+        return follower.vad
+
+    def end_frame(self) -> bool:
+        """Remove followers that did not analyze the leader's frame.
+
+        Returns False once the detector is no longer shared.
+        """
+        if self.speech is not None:
+            for follower in self.followers - self.followers_fed:
+                self.leave(follower)
+
+        self.speech = None
+        self.followers_fed.clear()
+
+        if self.followers:
+            return True
+
+        if isinstance(self.leader.vad, _SharedVad):
+            # Leader keeps detector
+            self.leader.vad = self.vad
+
+        return False
+
+
+class _SharedVad:
+    """Stand-in for a recorder's webrtcvad detector in a _VadGroup."""
+
+    __slots__ = ("group", "recorder")
+
+    def __init__(self, group: _VadGroup, recorder: WebRtcVadRecorder):
+        self.group = group
+        self.recorder = recorder
+
+    def is_speech(self, chunk: AudioBuffer, sample_rate: int) -> bool:
+        """True if webrtcvad detects speech in the current frame."""
+        group = self.group
+        if self.recorder is group.leader:
+            group.speech = bool(group.vad.is_speech(chunk, sample_rate))
+            return group.speech
+
+        if (group.speech is None) or (self.recorder not in group.followers):
+            # Leader did not analyze this frame
+            return group.leave(self.recorder).is_speech(chunk, sample_rate)
+
+        group.followers_fed.add(self.recorder)
+        return group.speech
+
+
+class ShadowRecorder(VoiceCommandRecorder):
+    """Run shadow recorder configurations alongside a primary recorder.
+
+    The primary recorder drives all results. For each audio frame, debiased
+    energy is computed once and shared with every configuration. Recorders with
+    the same VAD mode share one webrtcvad detector as long as they analyze the
+    same frames (e.g., with equal skip_seconds); a recorder that does not
+    continues with a detector of its own. Create shadows with keep_audio=False
+    to avoid buffering their audio.
+
+    Each primary voice command is compared with the first voice command of
+    every shadow after start(). Shadows that finish early keep analyzing audio,
+    but their later voice commands are ignored. A shadow that is still in a
+    voice command when the primary stops keeps receiving audio until it finishes
+    or times out, and the comparison is recorded then. Afterwards, it is
+    compared with the current primary voice command (if the primary does not
+    finish first). Call close() at the end of the audio stream to record
+    comparisons with unfinished shadows.
+
+    Attributes
+    ----------
+    primary: WebRtcVadRecorder
+        Recorder whose results are returned
+
+    shadows: Dict[str, WebRtcVadRecorder]
+        Named recorders evaluated on the same audio
+
+    stats: Dict[str, ShadowStats]
+        Accumulated divergence of each shadow from the primary
+
+    last_divergences: List[ShadowDivergence]
+        Divergence of each shadow for the most recently compared voice command
+    """
+
+    def __init__(
+        self,
+        primary: WebRtcVadRecorder,
+        shadows: typing.Mapping[str, WebRtcVadRecorder],
+    ):
+        super().__init__()
+        self.primary = primary
+        self.shadows = dict(shadows)
+
+        for name, shadow in self.shadows.items():
+            assert (
+                shadow.chunk_size == self.chunk_size
+            ), f"Chunk size of {name} must match primary ({self.chunk_size})"
+            assert (
+                shadow.sample_rate == self.sample_rate
+            ), f"Sample rate of {name} must match primary ({self.sample_rate})"
+
+        # Voice activity detectors shared by recorders with the same mode,
+        # led by the primary when possible
+        mode_recorders: typing.Dict[int, typing.List[WebRtcVadRecorder]] = {}
+        for recorder in self._all_recorders():
+            config = recorder.config
+            if config.use_vad and (not config.reset_vad) and (recorder.vad is None):
+                mode_recorders.setdefault(config.vad_mode, []).append(recorder)
+
+        self.vad_groups: typing.List[_VadGroup] = []
+        for leader, *followers in mode_recorders.values():
+            if followers:
+                vad_group = _VadGroup(leader)
+                for follower in followers:
+                    vad_group.add(follower)
+
+                self.vad_groups.append(vad_group)
+
+        self.stats: typing.Dict[str, ShadowStats] = {
+            name: ShadowStats() for name in self.shadows
+        }
+        self.last_divergences: typing.List[ShadowDivergence] = []
+
+        self.primary_command: typing.Optional[VoiceCommand] = None
+
+        # Comparison for the current primary voice command
+        self.comparison = _Comparison()
+        self.shadow_commands: typing.Dict[str, VoiceCommand] = self.comparison.commands
+
+        # Comparison that each unfinished shadow is evaluated for
+        self.shadow_comparisons: typing.Dict[str, _Comparison] = {}
+
+        # Stopped comparisons, waiting for shadows to finish
+        self.pending_comparisons: typing.Deque[_Comparison] = deque()
+
+    @property
+    def chunk_size(self) -> int:
+        """Bytes per audio frame of primary."""
+        return self.primary.chunk_size
+
+    @property
+    def sample_rate(self) -> int:
+        """Sample rate of primary (hertz)."""
+        return self.primary.sample_rate
+
+    def _all_recorders(self) -> typing.Iterable[WebRtcVadRecorder]:
+        yield self.primary
+        yield from self.shadows.values()
+
+    def start(self):
+        """Begin new voice command."""
+        self.primary.start()
+        self.primary_command = None
+        self.current_chunk = bytes()
+
+        self.comparison = _Comparison()
+        self.shadow_commands = self.comparison.commands
+
+        for name, shadow in self.shadows.items():
+            if name in self.shadow_comparisons:
+                # Joins once an earlier voice command is finished
+                continue
+
+            shadow.start()
+            self._add_shadow(name)
+
+    def stop(self) -> AudioBuffer:
+        """Free any resources, record divergence, and return primary audio.
+
+        Shadows that are still in a voice command are not stopped, and the
+        divergence is recorded once they finish.
+        """
+        self.current_chunk = bytes()
+        self.comparison.primary = self._get_boundaries(
+            self.primary, self.primary_command
+        )
+
+        for name, shadow in self.shadows.items():
+            shadow_comparison = self.shadow_comparisons.get(name)
+            if shadow_comparison is not None:
+                if shadow_comparison is not self.comparison:
+                    # Still finishing an earlier voice command
+                    self.comparison.shadows[name] = (None, None, None)
+                    continue
+
+                if shadow.in_phrase:
+                    # Keep feeding audio until voice command is finished
+                    continue
+
+                # Voice command was not started
+                self._finish_shadow(name, None)
+
+            shadow.stop()
+
+        self.pending_comparisons.append(self.comparison)
+        self._record_divergences()
+
+        return self.primary.stop()
+
+    def close(self):
+        """Stop unfinished shadows and record their divergence."""
+        for name, comparison in list(self.shadow_comparisons.items()):
+            if comparison.primary is not None:
+                self._finish_shadow(name, None)
+                self.shadows[name].stop()
+
+        self._record_divergences()
+
+    def process_frame(self, chunk: AudioBuffer) -> typing.Optional[VoiceCommand]:
+        """Process a single frame with all configurations."""
+        energy: typing.Optional[float] = None
+
+        def frame_args(recorder: WebRtcVadRecorder) -> typing.Dict[str, typing.Any]:
+            nonlocal energy
+
+            if recorder.skip_buffers_left > 0:
+                # Frame will be skipped
+                return {}
+
+            config = recorder.config
+            if (energy is None) and (
+                config.use_ratio
+                or config.use_current
+                or config.keep_frame_stats
+                or config.compute_energy
+            ):
+                energy = WebRtcVadRecorder.get_debiased_energy(chunk)
+
+            return {"energy": energy}
+
+        # Group leaders analyze the frame first
+        command = self.primary.process_frame(chunk, **frame_args(self.primary))
+        if command is not None:
+            self.primary_command = command
+
+        for name, shadow in self.shadows.items():
+            shadow_command = shadow.process_frame(chunk, **frame_args(shadow))
+            if shadow_command is None:
+                continue
+
+            shadow_comparison = self.shadow_comparisons.get(name)
+            if shadow_comparison is not None:
+                self._finish_shadow(name, shadow_command)
+
+            # Keep analyzing the same frames as the other recorders
+            shadow.stop()
+            shadow.start()
+
+            if (shadow_comparison is not None) and (
+                shadow_comparison is not self.comparison
+            ):
+                # Late for the current voice command
+                self._add_shadow(name)
+
+        if self.vad_groups:
+            self.vad_groups = [
+                vad_group for vad_group in self.vad_groups if vad_group.end_frame()
+            ]
+
+        if self.pending_comparisons:
+            self._record_divergences()
+
+        return command
+
+    def _add_shadow(self, name: str):
+        """Compare the next shadow voice command with the current primary's."""
+        self.shadow_comparisons[name] = self.comparison
+        self.comparison.waiting.add(name)
+
+    def _finish_shadow(self, name: str, command: typing.Optional[VoiceCommand]):
+        """Add shadow voice command (None if not finished) to its comparison."""
+        comparison = self.shadow_comparisons.pop(name)
+        comparison.shadows[name] = self._get_boundaries(self.shadows[name], command)
+        comparison.waiting.discard(name)
+
+        if command is not None:
+            comparison.commands[name] = command
+
+    def _record_divergences(self):
+        """Record divergence of stopped comparisons whose shadows have finished."""
+        while self.pending_comparisons and (not self.pending_comparisons[0].waiting):
+            comparison = self.pending_comparisons.popleft()
+            assert comparison.primary is not None
+            primary_result, primary_start, primary_end = comparison.primary
+
+            self.last_divergences = []
+            for name in self.shadows:
+                shadow_result, shadow_start, shadow_end = comparison.shadows[name]
+                divergence = ShadowDivergence(
+                    name=name,
+                    primary_result=primary_result,
+                    shadow_result=shadow_result,
+                )
+
+                if (primary_start is not None) and (shadow_start is not None):
+                    divergence.start_delta = shadow_start - primary_start
+
+                if (primary_end is not None) and (shadow_end is not None):
+                    divergence.end_delta = shadow_end - primary_end
+
+                self.last_divergences.append(divergence)
+                self.stats[name].add(divergence)
+
+    @staticmethod
+    def _get_boundaries(
+        recorder: WebRtcVadRecorder, command: typing.Optional[VoiceCommand]
+    ) -> _Boundaries:
+        """Get result, start time, and end time (seconds from start of stream)."""
+        result: typing.Optional[VoiceCommandResult] = None
+        events: typing.Iterable[VoiceCommandEvent] = recorder.events
+        if command is not None:
+            result = command.result
+            events = command.events
+
+        # Sample offsets include skipped audio, unlike event times
+        start_time: typing.Optional[float] = None
+        end_time: typing.Optional[float] = None
+        for event in events:
+            event_time = (recorder.start_sample + event.sample) / recorder.sample_rate
+            if (event.type == VoiceCommandEventType.STARTED) and (start_time is None):
+                start_time = event_time
+            elif event.type in (
+                VoiceCommandEventType.STOPPED,
+                VoiceCommandEventType.TIMEOUT,
+            ):
+                end_time = event_time
+
+        return result, start_time, end_time
@@ -0,0 +1,377 @@
+"""Compact append-only binary trace of recorder input and decisions.
+
+A trace file starts with a magic number and format version, followed by
+records. Every record starts with its type and a timestamp (nanoseconds since
+the writer was opened):
+
+* CONFIG - recorder settings as JSON (a new recorder starts here)
+* START/STOP - calls to start() and stop()
+* FRAME - flags, debiased energy, processing time, and raw audio of a frame
+
+Records are only ever appended, so a trace cut short by a crash can still be
+read up to its last complete record.
+"""
+import dataclasses
+import json
+import logging
+import math
+import mmap
+import struct
+import time
+import typing
+import weakref
+from dataclasses import dataclass
+from enum import IntEnum
+from pathlib import Path
+
+from .const import AudioBuffer, PhraseOverflowPolicy, RecorderConfig, SilenceMethod
+
+_LOGGER = logging.getLogger(__name__)
+
+TRACE_MAGIC = b"RSTR"
+TRACE_VERSION = 1
+
+# magic, version
+_FILE_HEADER = struct.Struct("<4sH")
+
+# type, time (ns)
+_RECORD_HEADER = struct.Struct("<BQ")
+
+# length of JSON
+_CONFIG_HEADER = struct.Struct("<I")
+
+# flags, energy, processing time (ns)
+_FRAME_HEADER = struct.Struct("<BfI")
+
+# record and frame headers packed together (hot path)
+_FRAME_RECORD_HEADER = struct.Struct(
+    "<" + _RECORD_HEADER.format[1:] + _FRAME_HEADER.format[1:]
+)
+
+# -----------------------------------------------------------------------------
+
+
+class TraceRecordType(IntEnum):
+    """Type of trace record."""
+
+    CONFIG = 1
+    START = 2
+    STOP = 3
+    FRAME = 4
+
+
+class TraceFrameFlags(IntEnum):
+    """Bit flags of a traced frame."""
+
+    SPEECH = 1
+    SKIPPED = 2
+    COMMAND = 4
+    ENERGY = 8
+
+
+@dataclass
+class TraceRecord:
+    """Single record read from a trace.
+
+    Attributes
+    ----------
+    type: TraceRecordType
+        Type of record
+
+    time_ns: int
+        Nanoseconds since trace writer was opened
+
+    config: Optional[RecorderConfig] = None
+        Recorder settings (CONFIG only)
+
+    frame: Optional[memoryview] = None
+        Raw audio of frame, a view into the trace that is released when the
+        next record is read (FRAME only)
+
+    flags: int = 0
+        TraceFrameFlags of frame (FRAME only)
+
+    energy: Optional[float] = None
+        Debiased energy of frame (FRAME only)
+
+    duration_ns: int = 0
+        Nanoseconds the recorder spent processing the frame (FRAME only)
+    """
+
+    type: TraceRecordType
+    time_ns: int
+    config: typing.Optional[RecorderConfig] = None
+    frame: typing.Optional[memoryview] = None
+    flags: int = 0
+    energy: typing.Optional[float] = None
+    duration_ns: int = 0
+
+    @property
+    def is_speech(self) -> bool:
+        """True if frame was detected as speech."""
+        return bool(self.flags & TraceFrameFlags.SPEECH)
+
+    @property
+    def skipped(self) -> bool:
+        """True if frame was skipped (skip_seconds)."""
+        return bool(self.flags & TraceFrameFlags.SKIPPED)
+
+    @property
+    def command(self) -> bool:
+        """True if a voice command finished on this frame."""
+        return bool(self.flags & TraceFrameFlags.COMMAND)
+
+
+# -----------------------------------------------------------------------------
+
+
+def config_to_json(config: RecorderConfig) -> str:
+    """Serialize recorder settings (derived values are not included)."""
+    return json.dumps(
+        {field.name: getattr(config, field.name) for field in _init_fields()}
+    )
+
+
+def config_from_json(config_json: typing.Union[str, bytes]) -> RecorderConfig:
+    """Deserialize recorder settings."""
+    config_dict = json.loads(config_json)
+    config_dict["silence_method"] = SilenceMethod(config_dict["silence_method"])
+    config_dict["phrase_overflow"] = PhraseOverflowPolicy(
+        config_dict["phrase_overflow"]
+    )
+
+    return RecorderConfig(**config_dict)
+
+
+def _init_fields() -> typing.Iterable[dataclasses.Field]:
+    return (field for field in dataclasses.fields(RecorderConfig) if field.init)
+
+
+# -----------------------------------------------------------------------------
+
+
+class TraceWriter:
+    """Appends recorder input and decisions to a trace file.
+
+    Attach to a recorder before start() (recorder.trace = writer), which writes
+    the recorder's settings, so the trace can be replayed from the same state.
+    Writes are buffered; call close() or flush() to make sure records reach the
+    file.
+
+    Attributes
+    ----------
+    trace_file: Union[str, Path, BinaryIO]
+        Path to trace (appended to if it exists) or binary file opened for writing
+
+    energy: bool = False
+        Record debiased energy of every frame, even if the recorder does not
+        need it (e.g., vad_only)
+    """
+
+    def __init__(
+        self,
+        trace_file: typing.Union[str, Path, typing.BinaryIO],
+        energy: bool = False,
+    ):
+        self.energy = energy
+        self.own_file = isinstance(trace_file, (str, Path))
+        if isinstance(trace_file, (str, Path)):
+            # Closed in close()
+            # pylint: disable=consider-using-with
+            self.trace_file: typing.BinaryIO = open(trace_file, "ab")
+        else:
+            self.trace_file = trace_file
+
+        self.start_ns = time.perf_counter_ns()
+
+        if self.trace_file.tell() == 0:
+            self.trace_file.write(_FILE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+
+    def write_config(self, config: RecorderConfig):
+        """Record settings of a recorder (frames that follow are replayed with it)."""
+        config_json = config_to_json(config).encode()
+        self._write_record(TraceRecordType.CONFIG, time.perf_counter_ns())
+        self.trace_file.write(_CONFIG_HEADER.pack(len(config_json)))
+        self.trace_file.write(config_json)
+
+    def write_start(self):
+        """Record call to start()."""
+        self._write_record(TraceRecordType.START, time.perf_counter_ns())
+
+    def write_stop(self):
+        """Record call to stop()."""
+        self._write_record(TraceRecordType.STOP, time.perf_counter_ns())
+
+    def write_frame(
+        self,
+        chunk: AudioBuffer,
+        flags: int,
+        energy: typing.Optional[float],
+        start_ns: int,
+        duration_ns: int,
+    ):
+        """Record a processed frame."""
+        if energy is not None:
+            flags |= TraceFrameFlags.ENERGY
+        else:
+            energy = math.nan
+
+        self.trace_file.write(
+            _FRAME_RECORD_HEADER.pack(
+                TraceRecordType.FRAME,
+                max(0, start_ns - self.start_ns),
+                flags,
+                energy,
+                min(duration_ns, 0xFFFFFFFF),
+            )
+        )
+        self.trace_file.write(chunk)
+
+    def flush(self):
+        """Flush buffered records to file."""
+        self.trace_file.flush()
+
+    def close(self):
+        """Flush and close trace file (if opened by writer)."""
+        self.flush()
+        if self.own_file:
+            self.trace_file.close()
+
+    def _write_record(self, record_type: TraceRecordType, time_ns: int):
+        self.trace_file.write(
+            _RECORD_HEADER.pack(record_type, max(0, time_ns - self.start_ns))
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TraceReader:
+    """Reads records from a memory-mapped trace file.
+
+    Frames are returned as views into the mapped file without copying, and are
+    released when the next record is read or the reader is closed. Copy a frame
+    (e.g., bytes(record.frame)) to keep it longer.
+
+    Attributes
+    ----------
+    trace_path: Union[str, Path]
+        Path to trace file
+    """
+
+    def __init__(self, trace_path: typing.Union[str, Path]):
+        self.trace_path = Path(trace_path)
+
+        # Closed in close()
+        # pylint: disable=consider-using-with
+        self.trace_file = open(self.trace_path, "rb")
+        self.trace_map = mmap.mmap(self.trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = _FILE_HEADER.unpack_from(self.trace_map, 0)
+        assert magic == TRACE_MAGIC, f"Not a trace file: {self.trace_path}"
+        assert (
+            version == TRACE_VERSION
+        ), f"Unsupported trace version {version} (expected {TRACE_VERSION})"
+
+        # Unfinished iterators, closed with the reader to release their views
+        self.iterators: typing.MutableSet[typing.Generator] = weakref.WeakSet()
+
+    def __iter__(self) -> typing.Iterator[TraceRecord]:
+        iterator = self._iter_records()
+        self.iterators.add(iterator)
+
+        return iterator
+
+    def _iter_records(self) -> typing.Generator[TraceRecord, None, None]:
+        trace_view = memoryview(self.trace_map)
+        frame: typing.Optional[memoryview] = None
+        offset = _FILE_HEADER.size
+        chunk_size = 0
+
+        try:
+            while offset < len(trace_view):
+                record, next_offset = self._read_record(trace_view, offset, chunk_size)
+                if record is None:
+                    _LOGGER.warning(
+                        "Incomplete record at byte %s of %s", offset, self.trace_path
+                    )
+                    break
+
+                if record.config is not None:
+                    chunk_size = record.config.chunk_size
+
+                offset = next_offset
+                frame = record.frame
+                yield record
+
+                if frame is not None:
+                    # Only valid until the next record
+                    frame.release()
+        finally:
+            # Views must be released before the trace is unmapped
+            if frame is not None:
+                frame.release()
+
+            trace_view.release()
+
+    @staticmethod
+    def _read_record(
+        trace_view: memoryview, offset: int, chunk_size: int
+    ) -> typing.Tuple[typing.Optional[TraceRecord], int]:
+        """Read record and get offset of next record (None if incomplete)."""
+        end = offset + _RECORD_HEADER.size
+        if end > len(trace_view):
+            return None, offset
+
+        record_type, time_ns = _RECORD_HEADER.unpack_from(trace_view, offset)
+        record = TraceRecord(type=TraceRecordType(record_type), time_ns=time_ns)
+
+        if record.type == TraceRecordType.CONFIG:
+            if (end + _CONFIG_HEADER.size) > len(trace_view):
+                return None, offset
+
+            (config_length,) = _CONFIG_HEADER.unpack_from(trace_view, end)
+            config_start = end + _CONFIG_HEADER.size
+            end = config_start + config_length
+            if end > len(trace_view):
+                return None, offset
+
+            record.config = config_from_json(trace_view[config_start:end].tobytes())
+        elif record.type == TraceRecordType.FRAME:
+            assert chunk_size > 0, "Frame before config"
+            frame_start = end + _FRAME_HEADER.size
+            end = frame_start + chunk_size
+            if end > len(trace_view):
+                return None, offset
+
+            record.flags, energy, record.duration_ns = _FRAME_HEADER.unpack_from(
+                trace_view, frame_start - _FRAME_HEADER.size
+            )
+            if record.flags & TraceFrameFlags.ENERGY:
+                record.energy = energy
+
+            record.frame = trace_view[frame_start:end]
+
+        return record, end
+
+    def close(self):
+        """Release frames, unmap, and close trace file."""
+        for iterator in list(self.iterators):
+            iterator.close()
+
+        try:
+            self.trace_map.close()
+        except BufferError:
+            # Unmapped once the remaining views are garbage collected
+            _LOGGER.warning("Views of %s are still in use", self.trace_path)
+
+        self.trace_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
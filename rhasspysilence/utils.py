@@ -1,11 +1,15 @@
 """Utility methods for rhasspysilence."""
-from . import WebRtcVadRecorder
+import dataclasses
+import typing
+
+from . import WebRtcVadRecorder, _byte_view
+from .const import AudioBuffer, AudioSegment, VoiceCommand
 
 # -----------------------------------------------------------------------------
 
 
 def trim_silence(
-    audio_bytes: bytes,
+    audio_bytes: AudioBuffer,
     ratio_threshold: float = 20.0,
     chunk_size: int = 960,
     skip_first_chunk=True,
@@ -13,29 +17,128 @@ def trim_silence(
     keep_chunks_after: int = 0,
 ) -> bytes:
     """Trim silence from start and end of audio using ratio of max/current energy."""
-    first_chunk = False
+    audio_view = _byte_view(audio_bytes)
+    start_sample, end_sample = trim_silence_offsets(
+        audio_view,
+        ratio_threshold=ratio_threshold,
+        chunk_size=chunk_size,
+        skip_first_chunk=skip_first_chunk,
+        keep_chunks_before=keep_chunks_before,
+        keep_chunks_after=keep_chunks_after,
+    )
+
+    # 16-bit samples
+    return audio_view[start_sample * 2 : end_sample * 2].tobytes()
+
+
+def trim_silence_offsets(
+    audio_bytes: AudioBuffer,
+    ratio_threshold: float = 20.0,
+    chunk_size: int = 960,
+    skip_first_chunk=True,
+    keep_chunks_before: int = 0,
+    keep_chunks_after: int = 0,
+) -> typing.Tuple[int, int]:
+    """Get start/end sample offsets (end exclusive) of audio with silence trimmed.
+
+    Same as trim_silence, but no audio is copied.
+    """
+    audio_view = _byte_view(audio_bytes)
+    num_chunks = len(audio_view) // chunk_size
+
+    # Offset of first analyzed chunk
+    first_offset = 0
+    if skip_first_chunk and (num_chunks > 0):
+        first_offset = chunk_size
+        num_chunks -= 1
+
     energies = []
-    max_energy = None
-    while len(audio_bytes) >= chunk_size:
-        chunk = audio_bytes[:chunk_size]
-        audio_bytes = audio_bytes[chunk_size:]
+    for chunk_index in range(num_chunks):
+        chunk_start = first_offset + (chunk_index * chunk_size)
+        chunk = audio_view[chunk_start : chunk_start + chunk_size]
+        energies.append(WebRtcVadRecorder.get_debiased_energy(chunk))
+
+    start_index, end_index = get_trim_range(
+        energies,
+        ratio_threshold=ratio_threshold,
+        keep_chunks_before=keep_chunks_before,
+        keep_chunks_after=keep_chunks_after,
+    )
+
+    # Chunks are contiguous, so keep a single range
+    keep_start = first_offset + (start_index * chunk_size)
+    keep_end = first_offset + ((end_index + 1) * chunk_size)
+
+    return keep_start // 2, keep_end // 2
+
 
-        if skip_first_chunk and (not first_chunk):
-            first_chunk = True
-            continue
+def trim_command(
+    command: VoiceCommand,
+    ratio_threshold: float = 20.0,
+    skip_first_chunk=True,
+    keep_chunks_before: int = 0,
+    keep_chunks_after: int = 0,
+) -> VoiceCommand:
+    """Trim silence from a voice command using its recorded frame statistics.
+
+    Gives the same audio as trim_silence with the recorder's chunk size, but
+    without re-computing energies. Requires keep_frame_stats=True.
+
+    Audio data (if kept) is sliced, and the segment (if any) is narrowed to the
+    trimmed sample offsets.
+    """
+    assert command.frame_stats is not None, "No frame statistics"
+
+    chunk_size = command.frame_stats.chunk_size
+    energies: typing.Sequence[float] = command.frame_stats.energies
+    first_offset = 0
+    if skip_first_chunk and energies:
+        first_offset = chunk_size
+        energies = energies[1:]
+
+    start_index, end_index = get_trim_range(
+        energies,
+        ratio_threshold=ratio_threshold,
+        keep_chunks_before=keep_chunks_before,
+        keep_chunks_after=keep_chunks_after,
+    )
 
-        energy = max(1, WebRtcVadRecorder.get_debiased_energy(chunk))
-        energies.append((energy, chunk))
+    keep_start = first_offset + (start_index * chunk_size)
+    keep_end = first_offset + ((end_index + 1) * chunk_size)
 
-        if (max_energy is None) or (energy > max_energy):
-            max_energy = energy
+    audio_data: typing.Optional[AudioBuffer] = None
+    if command.audio_data is not None:
+        audio_data = command.audio_data[keep_start:keep_end]
+
+    segment: typing.Optional[AudioSegment] = None
+    if command.segment is not None:
+        # Frame statistics start at the beginning of the segment (16-bit samples)
+        trim_start = command.segment.before_start + (keep_start // 2)
+        segment = AudioSegment(
+            before_start=trim_start,
+            start=trim_start,
+            end=command.segment.before_start + (keep_end // 2),
+        )
+
+    return dataclasses.replace(command, audio_data=audio_data, segment=segment)
+
+
+def get_trim_range(
+    energies: typing.Sequence[float],
+    ratio_threshold: float = 20.0,
+    keep_chunks_before: int = 0,
+    keep_chunks_after: int = 0,
+) -> typing.Tuple[int, int]:
+    """Get start/end chunk indexes (inclusive) to keep using ratio of max/current energy."""
+    energies = [max(1, energy) for energy in energies]
+    assert energies, "No maximum energy"
+    max_energy = max(energies)
 
     # Determine chunks below threshold
-    assert max_energy is not None, "No maximum energy"
     start_index = None
     end_index = None
 
-    for i, (energy, chunk) in enumerate(energies):
+    for i, energy in enumerate(energies):
         ratio = max_energy / energy
         if ratio < ratio_threshold:
             end_index = None
@@ -53,8 +156,4 @@ def trim_silence(
     start_index = max(0, start_index - 1 - keep_chunks_before)
     end_index = min(len(energies) - 1, end_index + 1 + keep_chunks_after)
 
-    keep_bytes = bytes()
-    for _, chunk in energies[start_index : end_index + 1]:
-        keep_bytes += chunk
-
-    return keep_bytes
+    return start_index, end_index
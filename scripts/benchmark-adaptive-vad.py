@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Compare CPU time and voice command boundaries with adaptive webrtcvad rate.
+
+Each WAV file is padded with background audio, then processed at full rate and with several adaptive settings.
+Reports time per frame, frames whose webrtcvad result was inferred (calls
+saved), voice commands found, and how far the voice command start/end moved
+compared to full rate. Files without voice commands (e.g., noise) have no
+deviation; any commands found there are false detections.
+"""
+
+import argparse
+import dataclasses
+import os
+import sys
+import time
+import typing
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rhasspysilence import WebRtcVadRecorder  # noqa: E402
+from rhasspysilence.const import RecorderConfig, VoiceCommand  # noqa: E402
+
+_DIR = os.path.dirname(__file__)
+_DEFAULT_WAVS = [
+    os.path.join(_DIR, "..", "etc", "turn_on_living_room_lamp.wav"),
+    os.path.join(_DIR, "..", "etc", "noise.wav"),
+]
+_DEFAULT_BACKGROUND = os.path.join(_DIR, "..", "etc", "noise.wav")
+
+# -----------------------------------------------------------------------------
+
+
+def run_recorder(
+    config: RecorderConfig, audio_data: bytes
+) -> typing.Tuple[typing.List[VoiceCommand], int, int]:
+    """Get voice commands, frames analyzed, and frames inferred."""
+    recorder = WebRtcVadRecorder(config=config)
+    recorder.start()
+
+    commands: typing.List[VoiceCommand] = []
+    num_frames = 0
+    num_inferred = 0
+    for offset in range(0, len(audio_data), config.chunk_size):
+        command = recorder.process_chunk(
+            audio_data[offset : offset + config.chunk_size]
+        )
+        if command is not None:
+            commands.append(command)
+            num_frames += recorder.current_sample // config.samples_per_buffer
+            num_inferred += recorder.vad_frames_inferred
+            recorder.stop()
+            recorder.start()
+
+    num_frames += recorder.current_sample // config.samples_per_buffer
+    num_inferred += recorder.vad_frames_inferred
+    recorder.stop()
+
+    return commands, num_frames, num_inferred
+
+
+def get_boundaries(commands: typing.List[VoiceCommand]) -> typing.List[int]:
+    """Start/end samples of each voice command."""
+    boundaries: typing.List[int] = []
+    for command in commands:
+        if command.segment is None:
+            # Timeout before voice command started
+            continue
+
+        boundaries.extend([command.segment.start, command.segment.end])
+
+    return boundaries
+
+
+def get_max_deviation(
+    boundaries: typing.List[int], full_boundaries: typing.List[int], sample_rate: int
+) -> str:
+    """Largest boundary difference in milliseconds."""
+    if not full_boundaries:
+        # No voice commands at full rate
+        return "-"
+
+    if len(boundaries) != len(full_boundaries):
+        return f"{len(boundaries) // 2} vs {len(full_boundaries) // 2} boundaries"
+
+    max_samples = max(
+        (abs(b1 - b2) for b1, b2 in zip(boundaries, full_boundaries)), default=0
+    )
+
+    return f"{1000 * max_samples / sample_rate:.0f}"
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(prog="benchmark-adaptive-vad")
+    parser.add_argument("wav_file", nargs="*", help="16Khz 16-bit mono WAV file(s)")
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Number of timed runs (best is used)"
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        nargs="+",
+        default=[3, 5, 10],
+        help="Values of adaptive_vad_frames to try",
+    )
+    parser.add_argument(
+        "--max-error",
+        type=float,
+        nargs="+",
+        default=[0.06, 0.12, 0.18],
+        help="Values of adaptive_vad_max_error to try (seconds)",
+    )
+    parser.add_argument(
+        "--background",
+        default=_DEFAULT_BACKGROUND,
+        help="WAV file with background audio (default: etc/noise.wav)",
+    )
+    parser.add_argument(
+        "--pad-seconds",
+        type=float,
+        default=10,
+        help="Seconds of background audio added before/after each file",
+    )
+    args = parser.parse_args()
+
+    wav_paths = args.wav_file or _DEFAULT_WAVS
+    full_config = RecorderConfig(max_seconds=None)
+
+    # Long stable runs before/after each file
+    with wave.open(args.background, "r") as background_file:
+        background = background_file.readframes(background_file.getnframes())
+
+    pad_bytes = 2 * int(args.pad_seconds * full_config.sample_rate)
+    pad = (background * (1 + (pad_bytes // len(background))))[:pad_bytes]
+
+    print(
+        "file",
+        "frames",
+        "max_error",
+        "us/frame",
+        "cpu_saved",
+        "inferred",
+        "commands",
+        "max_deviation_ms",
+        sep="\t",
+    )
+
+    for wav_path in wav_paths:
+        with wave.open(wav_path, "r") as wav_file:
+            assert wav_file.getframerate() == full_config.sample_rate
+            audio_data = pad + wav_file.readframes(wav_file.getnframes()) + pad
+
+        configs = [full_config] + [
+            dataclasses.replace(
+                full_config,
+                adaptive_vad_frames=adaptive_frames,
+                adaptive_vad_max_error=max_error,
+            )
+            for adaptive_frames in args.frames
+            for max_error in args.max_error
+        ]
+
+        # Interleave timed runs so load changes affect all configs alike
+        best_times = [float("inf")] * len(configs)
+        for _ in range(args.repeat):
+            for config_index, config in enumerate(configs):
+                start_time = time.perf_counter()
+                run_recorder(config, audio_data)
+                best_times[config_index] = min(
+                    best_times[config_index], time.perf_counter() - start_time
+                )
+
+        full_commands, _, _ = run_recorder(full_config, audio_data)
+        full_boundaries = get_boundaries(full_commands)
+        full_time = best_times[0]
+
+        name = os.path.basename(wav_path)
+        for config, best_time in zip(configs, best_times):
+            commands, num_frames, num_inferred = run_recorder(config, audio_data)
+            boundaries = get_boundaries(commands)
+            max_deviation = get_max_deviation(
+                boundaries, full_boundaries, config.sample_rate
+            )
+
+            print(
+                name,
+                config.adaptive_vad_frames or "-",
+                config.adaptive_vad_max_error if config.adaptive_vad_frames else "-",
+                f"{1e6 * best_time / num_frames:.2f}",
+                f"{100 * (1 - (best_time / full_time)):.0f}%",
+                f"{100 * num_inferred / num_frames:.0f}%",
+                len(boundaries) // 2,
+                max_deviation,
+                sep="\t",
+            )
+
+
+# -----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env bash
+# Compares reading audio files directly with piping raw audio from sox.
+#
+# Usage: benchmark-input.sh [REPEAT] [FILE ...]
+set -e
+
+# Directory of *this* script
+this_dir="$( cd "$( dirname "$0" )" && pwd )"
+src_dir="$(realpath "${this_dir}/..")"
+
+venv="${src_dir}/.venv"
+if [[ -d "${venv}" ]]; then
+    echo "Using virtual environment at ${venv}"
+    source "${venv}/bin/activate"
+fi
+
+export PYTHONPATH="${src_dir}:${PYTHONPATH}"
+
+repeat="${1:-20}"
+shift || true
+
+audio_files=("$@")
+if [[ -z "${audio_files[*]}" ]]; then
+    audio_files=("${src_dir}/etc"/*.wav)
+fi
+
+# -----------------------------------------------------------------------------
+
+for audio_file in "${audio_files[@]}"; do
+    echo "${audio_file}"
+
+    echo -n 'sox pipe: '
+    time (
+        for _ in $(seq "${repeat}"); do
+            sox "${audio_file}" -r 16000 -e signed-integer -b 16 -c 1 -t raw - | \
+                python3 -m rhasspysilence --quiet 2>/dev/null
+        done
+    )
+
+    echo -n 'direct: '
+    time (
+        for _ in $(seq "${repeat}"); do
+            python3 -m rhasspysilence --quiet "${audio_file}" 2>/dev/null
+        done
+    )
+
+    echo ''
+done
+
+# -----------------------------------------------------------------------------
+
+echo "OK"
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Measure memory used per WebRtcVadRecorder session.
+
+Creates N recorders sharing one configuration and reports bytes per session
+when idle (created), started, and after each has analyzed some silence.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+import typing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rhasspysilence import WebRtcVadRecorder  # noqa: E402
+from rhasspysilence.const import RecorderConfig  # noqa: E402
+
+# -----------------------------------------------------------------------------
+
+
+def get_rss() -> int:
+    """Resident set size of this process in bytes (Linux only)."""
+    with open("/proc/self/statm", "r") as statm_file:
+        return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(prog="session-memory")
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="Number of sessions to create",
+    )
+    parser.add_argument(
+        "--frames", type=int, default=10, help="Frames of silence per session"
+    )
+    args = parser.parse_args()
+
+    config = RecorderConfig()
+    silence = bytes(config.chunk_size)
+
+    print("sessions", "state", "heap/session", "rss/session", sep="\t")
+    for num_sessions in args.sessions:
+        gc.collect()
+        tracemalloc.start()
+        start_heap = tracemalloc.get_traced_memory()[0]
+        start_rss = get_rss()
+
+        def report(state: str):
+            heap = tracemalloc.get_traced_memory()[0] - start_heap
+            rss = get_rss() - start_rss
+            print(
+                num_sessions,
+                state,
+                f"{heap / num_sessions:.0f}",
+                f"{rss / num_sessions:.0f}",
+                sep="\t",
+            )
+
+        recorders: typing.List[WebRtcVadRecorder] = [
+            WebRtcVadRecorder(config=config) for _ in range(num_sessions)
+        ]
+        report("idle")
+
+        for recorder in recorders:
+            recorder.start()
+
+        report("started")
+
+        for recorder in recorders:
+            for _ in range(args.frames):
+                recorder.process_chunk(silence)
+
+        report("listening")
+
+        for recorder in recorders:
+            recorder.stop()
+
+        report("stopped")
+
+        del recorders
+        tracemalloc.stop()
+
+
+# -----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     package_data={"rhasspysilence": ["py.typed"]},
     install_requires=requirements,
+    extras_require={"soundfile": ["soundfile"]},
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.7",
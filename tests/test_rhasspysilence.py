@@ -1,11 +1,63 @@
 """Tests for rhasspysilence."""
+import array
+import audioop
+import time
+import typing
 import wave
+from pathlib import Path
 
-from rhasspysilence import VoiceCommandResult, WebRtcVadRecorder
+import pytest
+
+from rhasspysilence import (
+    PhraseOverflowPolicy,
+    RecorderConfig,
+    SilenceMethod,
+    VoiceCommand,
+    VoiceCommandRecorder,
+    VoiceCommandResult,
+    WebRtcVadRecorder,
+)
+from rhasspysilence.__main__ import read_audio_file
+from rhasspysilence.endpoint import EndpointStats
+from rhasspysilence.energy import WindowMaxEnergy, WindowQuantileEnergy
+from rhasspysilence.pipeline import (
+    MapStage,
+    Pipeline,
+    RecorderStage,
+    StageMode,
+    TrimStage,
+)
+from rhasspysilence.replay import replay_trace
+from rhasspysilence.shadow import ShadowRecorder
+from rhasspysilence.trace import TraceReader, TraceRecordType, TraceWriter
+from rhasspysilence.utils import trim_command, trim_silence, trim_silence_offsets
 
 CHUNK_SIZE = 2048
 
 
+def _read_wav(wav_path: str) -> bytes:
+    """Read all audio frames from a WAV file."""
+    with wave.open(wav_path, "r") as wav_file:
+        return wav_file.readframes(wav_file.getnframes())
+
+
+def _get_command(
+    recorder: VoiceCommandRecorder,
+    audio_data: bytes,
+    chunk_type: typing.Callable[[bytes], typing.Any] = bytes,
+) -> typing.Optional[VoiceCommand]:
+    """Start recorder and process audio in chunks until a voice command ends."""
+    recorder.start()
+    for offset in range(0, len(audio_data), CHUNK_SIZE):
+        command = recorder.process_chunk(
+            chunk_type(audio_data[offset : offset + CHUNK_SIZE])
+        )
+        if command:
+            return command
+
+    return None
+
+
 def test_command():
     """Verify voice command sample WAV file."""
     command = None
@@ -46,3 +98,796 @@ def test_noise():
                 break
 
         assert not command
+
+
+def test_buffer_protocol():
+    """Verify recorder accepts bytearray, memoryview, and array input."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    expected = _get_command(WebRtcVadRecorder(), audio_data)
+    assert expected
+
+    for chunk_type in [
+        bytearray,
+        memoryview,
+        lambda chunk: array.array("h", chunk),
+    ]:
+        command = _get_command(WebRtcVadRecorder(), audio_data, chunk_type)
+        assert command
+        assert command.audio_data == expected.audio_data
+        assert command.events == expected.events
+
+
+def test_exact_frames():
+    """Verify each complete frame is processed without waiting for more audio."""
+    audio_data = _read_wav("etc/noise.wav")
+
+    recorder = WebRtcVadRecorder()
+    recorder.start()
+
+    chunk_size = recorder.chunk_size
+    for offset in range(0, len(audio_data) - chunk_size + 1, chunk_size):
+        assert recorder.process_chunk(audio_data[offset : offset + chunk_size]) is None
+        assert recorder.current_sample == (offset + chunk_size) // 2
+
+    # Partial frame is held until it is complete
+    recorder.start()
+    assert recorder.process_chunk(audio_data[: chunk_size - 2]) is None
+    assert recorder.current_sample == 0
+    assert recorder.process_chunk(audio_data[chunk_size - 2 : chunk_size]) is None
+    assert recorder.current_sample == recorder.samples_per_buffer
+
+
+def test_recorder_interface():
+    """Verify recorders must provide chunk_size and process_frame."""
+
+    class IncompleteRecorder(VoiceCommandRecorder):
+        """Recorder without chunk_size or process_frame."""
+
+        def start(self):
+            pass
+
+        def stop(self) -> bytes:
+            return bytes()
+
+    with pytest.raises(TypeError):
+        IncompleteRecorder()  # pylint: disable=abstract-class-instantiated
+
+
+def test_trim_command():
+    """Verify trimming with frame statistics matches trim_silence."""
+    recorder = WebRtcVadRecorder(keep_frame_stats=True)
+    command = _get_command(recorder, _read_wav("etc/turn_on_living_room_lamp.wav"))
+    assert command
+    assert command.audio_data
+    assert command.frame_stats
+    assert len(command.frame_stats.energies) == (
+        len(command.audio_data) // recorder.chunk_size
+    )
+
+    for keep_before, keep_after in [(0, 0), (2, 3), (100, 100)]:
+        trimmed_command = trim_command(
+            command, keep_chunks_before=keep_before, keep_chunks_after=keep_after
+        )
+        assert trimmed_command.audio_data == trim_silence(
+            command.audio_data,
+            chunk_size=recorder.chunk_size,
+            keep_chunks_before=keep_before,
+            keep_chunks_after=keep_after,
+        )
+
+
+def test_compute_energy():
+    """Verify energy is only computed for vad_only when asked."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    recorder = WebRtcVadRecorder()
+    assert _get_command(recorder, audio_data)
+    assert recorder.last_energy is None
+    assert recorder.max_energy is None
+
+    energy_recorder = WebRtcVadRecorder(compute_energy=True)
+    command = _get_command(energy_recorder, audio_data)
+    assert command
+    assert energy_recorder.last_energy is not None
+    assert energy_recorder.max_energy
+    assert energy_recorder.get_max_current_ratio(energy_recorder.max_energy) == 1
+
+    # Frame statistics are not kept
+    assert command.frame_stats is None
+    assert energy_recorder.phrase_stats is None
+
+
+def test_phrase_overflow():
+    """Verify truncating and spilling voice command audio beyond a limit."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    def get_command(**kwargs):
+        recorder = WebRtcVadRecorder(max_events=2, **kwargs)
+        command = _get_command(recorder, audio_data)
+        assert len(recorder.events) <= 2
+        return command
+
+    expected = get_command()
+    assert expected
+    assert expected.audio_data
+
+    max_phrase_bytes = 10 * 960
+    spilled = get_command(
+        max_phrase_bytes=max_phrase_bytes,
+        phrase_overflow=PhraseOverflowPolicy.SPILL,
+        keep_frame_stats=True,
+    )
+    assert spilled
+
+    # File-backed, not read back into memory
+    assert isinstance(spilled.audio_data, memoryview)
+    assert spilled.audio_data == expected.audio_data
+    assert spilled.frame_stats is None
+
+    truncated = get_command(
+        max_phrase_bytes=max_phrase_bytes,
+        phrase_overflow=PhraseOverflowPolicy.TRUNCATE,
+    )
+    assert truncated
+    assert truncated.audio_data
+    assert len(truncated.audio_data) < len(expected.audio_data)
+    assert expected.audio_data.startswith(truncated.audio_data)
+
+
+def test_shadow():
+    """Verify shadow configurations match independent recorders."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    primary_config = {"silence_seconds": 1.0}
+    configs = {
+        "same": primary_config,
+        "short_silence": {},
+        "vad_1": {"vad_mode": 1},
+        "ratio": {
+            "silence_method": SilenceMethod.VAD_AND_RATIO,
+            "max_current_ratio_threshold": 20,
+        },
+    }
+
+    expected = {
+        name: _get_command(WebRtcVadRecorder(**kwargs), audio_data)
+        for name, kwargs in configs.items()
+    }
+    expected_primary = _get_command(WebRtcVadRecorder(**primary_config), audio_data)
+
+    shadow = ShadowRecorder(
+        WebRtcVadRecorder(**primary_config),
+        {name: WebRtcVadRecorder(**kwargs) for name, kwargs in configs.items()},
+    )
+    command = _get_command(shadow, audio_data)
+    assert command == expected_primary
+    assert "same" in shadow.shadow_commands
+    assert "short_silence" in shadow.shadow_commands
+    for name, shadow_command in shadow.shadow_commands.items():
+        assert shadow_command == expected[name]
+
+    # Ratio shadow has not finished yet
+    shadow.stop()
+    assert not shadow.last_divergences
+
+    shadow.start()
+    background = _read_wav("etc/noise.wav")
+    for offset in range(0, len(background), CHUNK_SIZE):
+        shadow.process_chunk(background[offset : offset + CHUNK_SIZE])
+
+    divergences = {d.name: d for d in shadow.last_divergences}
+    assert divergences["same"].start_delta == 0
+    assert divergences["same"].end_delta == 0
+    assert shadow.stats["same"].result_mismatches == 0
+    assert divergences["short_silence"].end_delta < 0
+    assert divergences["ratio"].shadow_result == VoiceCommandResult.SUCCESS
+    assert divergences["ratio"].end_delta > 0
+
+
+def test_shadow_longer_silence():
+    """Verify shadows that finish after the primary are still compared."""
+    background = _read_wav("etc/noise.wav")
+    command_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+    audio_data = (command_data + background) * 2
+
+    expected = _get_command(WebRtcVadRecorder(silence_seconds=1.0), audio_data)
+    assert expected and expected.segment
+
+    recorder = ShadowRecorder(
+        WebRtcVadRecorder(),
+        {"long_silence": WebRtcVadRecorder(silence_seconds=1.0, keep_audio=False)},
+    )
+    recorder.start()
+
+    end_samples = []
+    chunk_view = memoryview(audio_data)
+    while chunk_view:
+        command = recorder.process_chunk(chunk_view)
+        if command is None:
+            break
+
+        assert command.segment
+        end_samples.append(command.segment.end)
+
+        chunk_view = chunk_view[recorder.chunk_offset :]
+        recorder.stop()
+        recorder.start()
+
+    recorder.close()
+    assert len(end_samples) == 2
+
+    stats = recorder.stats["long_silence"]
+    assert stats.commands == 2
+    assert stats.result_mismatches == 0
+    assert stats.end_count == 2
+
+    # First shadow voice command is the same as on its own
+    assert stats.max_end_delta == pytest.approx(
+        (expected.segment.end - end_samples[0]) / recorder.sample_rate
+    )
+
+
+def test_shadow_vad():
+    """Verify shared webrtcvad detectors do not change results."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    primary_config = {"skip_seconds": 0.5, "vad_mode": 1}
+    shadow_config = {"vad_mode": 1, "silence_seconds": 0.3}
+    expected_primary = _get_command(WebRtcVadRecorder(**primary_config), audio_data)
+    expected_shadow = _get_command(WebRtcVadRecorder(**shadow_config), audio_data)
+
+    # Shadow does not skip, so it does not analyze the same frames as primary
+    shadow = ShadowRecorder(
+        WebRtcVadRecorder(**primary_config),
+        {"no_skip": WebRtcVadRecorder(**shadow_config)},
+    )
+    assert _get_command(shadow, audio_data) == expected_primary
+    assert shadow.shadow_commands["no_skip"] == expected_shadow
+
+
+def test_segment():
+    """Verify sample offsets match recorded and trimmed audio."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    def get_command(**kwargs):
+        recorder = WebRtcVadRecorder(skip_seconds=0.1, keep_frame_stats=True, **kwargs)
+        return _get_command(recorder, audio_data)
+
+    command = get_command()
+    assert command
+    assert command.segment
+    segment = command.segment
+    assert command.audio_data == audio_data[segment.before_start * 2 : segment.end * 2]
+    assert command.events[-1].sample == segment.end
+
+    # No audio kept
+    index_command = get_command(keep_audio=False)
+    assert index_command
+    assert index_command.audio_data is None
+    assert index_command.segment == segment
+
+    trimmed_segment = trim_command(index_command).segment
+    assert trimmed_segment
+    assert (
+        audio_data[trimmed_segment.start * 2 : trimmed_segment.end * 2]
+        == trim_command(command).audio_data
+    )
+
+    start_sample, end_sample = trim_silence_offsets(command.audio_data)
+    assert command.audio_data[start_sample * 2 : end_sample * 2] == trim_silence(
+        command.audio_data
+    )
+
+
+def test_stop_drops_chunk():
+    """Verify stop() keeps no audio or views from the last chunk."""
+    command_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+    recorder = WebRtcVadRecorder()
+
+    def get_command(audio_buffer: bytearray) -> typing.Optional[VoiceCommand]:
+        recorder.start()
+        command = recorder.process_chunk(audio_buffer)
+        recorder.stop()
+
+        # Reusable buffer is no longer referenced
+        audio_buffer.clear()
+        return command
+
+    command = get_command(bytearray(command_data + bytes(4_000)))
+    assert command
+
+    # Leftover audio from the first session is not processed
+    assert get_command(bytearray(command_data[:4_000])) is None
+    assert not recorder.events
+
+
+def test_stream_segments():
+    """Verify segments of several voice commands in one buffer are stream offsets."""
+    background = _read_wav("etc/noise.wav")
+    command_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    audio_data = (command_data + background) * 2
+
+    def get_commands(chunk_size: int):
+        recorder = WebRtcVadRecorder()
+        recorder.start()
+
+        commands = []
+        for offset in range(0, len(audio_data), chunk_size):
+            chunk_view = memoryview(audio_data)[offset : offset + chunk_size]
+            command = recorder.process_chunk(chunk_view)
+            while command:
+                # Rest of chunk is not kept
+                assert not recorder.current_chunk
+                chunk_view = chunk_view[recorder.chunk_offset :]
+                commands.append((command, recorder.stop()))
+                recorder.start()
+                command = recorder.process_chunk(chunk_view)
+
+        return commands
+
+    commands = get_commands(len(audio_data))
+    assert len(commands) == 2
+
+    for command, audio in commands:
+        assert command.segment
+        segment = command.segment
+        assert bytes(audio) == audio_data[segment.before_start * 2 : segment.end * 2]
+
+    # Second command is offset by the length of the first copy (within a frame)
+    first_segment = commands[0][0].segment
+    second_segment = commands[1][0].segment
+    assert first_segment and second_segment
+    copy_samples = (len(command_data) + len(background)) // 2
+    assert (
+        abs((second_segment.start - first_segment.start) - copy_samples)
+        < WebRtcVadRecorder().samples_per_buffer
+    )
+
+    # Same offsets when audio arrives in small chunks
+    chunked_commands = get_commands(CHUNK_SIZE + 2)
+    assert [c.segment for c, _ in chunked_commands] == [c.segment for c, _ in commands]
+
+
+def test_shared_config():
+    """Verify recorders sharing a config match separately configured recorders."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    config = RecorderConfig(keep_frame_stats=True)
+    recorders = [WebRtcVadRecorder(config=config) for _ in range(2)]
+    recorders.append(WebRtcVadRecorder(keep_frame_stats=True))
+
+    for recorder in recorders:
+        # Idle recorders hold no detector or buffers
+        assert not hasattr(recorder, "__dict__")
+        assert recorder.vad is None
+        assert recorder.before_phrase_chunks is None
+        assert recorder.phrase_buffer is None
+        assert recorder.chunk_size == config.chunk_size
+
+    with pytest.raises(AttributeError):
+        recorders[0].chunk_size = 480
+
+    # Newer settings are only in the config
+    assert not hasattr(recorders[0], "max_events")
+
+    commands = []
+    for recorder in recorders:
+        commands.append(_get_command(recorder, audio_data))
+
+        # Detector is kept across voice commands
+        vad = recorder.vad
+        assert vad is not None
+        recorder.stop()
+        assert recorder.vad is vad
+
+    assert commands[0]
+    assert commands[0] == commands[1] == commands[2]
+
+
+def test_reset_vad():
+    """Verify a new detector is only used for each voice command when asked."""
+    background = _read_wav("etc/noise.wav")
+    command_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+    audio_data = command_data + background + command_data
+
+    def get_segments(recorder: WebRtcVadRecorder):
+        recorder.start()
+
+        segments = []
+        chunk_view = memoryview(audio_data)
+        while chunk_view:
+            command = recorder.process_chunk(chunk_view)
+            if command is None:
+                break
+
+            chunk_view = chunk_view[recorder.chunk_offset :]
+            segments.append(command.segment)
+            recorder.stop()
+            recorder.start()
+
+        return segments
+
+    recorder = WebRtcVadRecorder(vad_mode=1)
+    segments = get_segments(recorder)
+    assert len(segments) == 2
+    assert recorder.vad is not None
+
+    # A fresh detector has not adapted to the background noise yet
+    reset_recorder = WebRtcVadRecorder(vad_mode=1, reset_vad=True)
+    reset_segments = get_segments(reset_recorder)
+    assert reset_segments[0] == segments[0]
+    assert len(reset_segments) > len(segments)
+
+    reset_recorder.stop()
+    assert reset_recorder.vad is None
+
+
+def test_adaptive_vad():
+    """Verify adaptive VAD rate keeps boundaries within the error bound."""
+    background = _read_wav("etc/noise.wav")
+    audio_data = background + _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    full_command = _get_command(WebRtcVadRecorder(), audio_data)
+    assert full_command
+
+    adaptive_recorder = WebRtcVadRecorder(
+        adaptive_vad_frames=5, adaptive_vad_max_error=0.18
+    )
+    adaptive_command = _get_command(adaptive_recorder, audio_data)
+    assert adaptive_command
+    assert adaptive_recorder.vad_frames_inferred > 0
+
+    # Transitions are noticed at most 3 frames (90 ms) late
+    max_error = 3 * adaptive_recorder.samples_per_buffer
+    assert full_command.segment and adaptive_command.segment
+    assert abs(adaptive_command.segment.start - full_command.segment.start) <= max_error
+    assert abs(adaptive_command.segment.end - full_command.segment.end) <= max_error
+
+
+def test_adaptive_silence():
+    """Verify adaptive silence ends voice command early and reports latency saved."""
+    background = _read_wav("etc/noise.wav")
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav") + background
+
+    fixed_command = _get_command(WebRtcVadRecorder(), audio_data)
+    assert fixed_command
+    assert fixed_command.latency_saved is None
+
+    recorder = WebRtcVadRecorder(adaptive_silence=True)
+    adaptive_command = _get_command(recorder, audio_data)
+    assert adaptive_command
+    assert adaptive_command.result == VoiceCommandResult.SUCCESS
+
+    # Silence continues, so the estimate is exact
+    assert adaptive_command.latency_saved is not None
+    assert adaptive_command.latency_saved > 0
+    assert fixed_command.segment and adaptive_command.segment
+    assert (fixed_command.segment.end - adaptive_command.segment.end) == round(
+        adaptive_command.latency_saved * recorder.sample_rate
+    )
+
+    assert recorder.endpoint_stats is not None
+    assert recorder.endpoint_stats.commands == 1
+    assert recorder.endpoint_stats.early_ratio == 1
+    assert recorder.endpoint_stats.min_saved_seconds == adaptive_command.latency_saved
+
+
+def test_endpoint_stats():
+    """Verify min/max latency saved when all commands end early or late."""
+    stats = EndpointStats()
+    assert stats.min_saved_seconds is None
+    assert stats.max_saved_seconds is None
+
+    for saved_seconds in [0.2, 0.5, 0.3]:
+        stats.add(saved_seconds)
+
+    assert stats.early == 3
+    assert stats.min_saved_seconds == 0.2
+    assert stats.max_saved_seconds == 0.5
+
+    stats = EndpointStats()
+    for saved_seconds in [-0.2, -0.5]:
+        stats.add(saved_seconds)
+
+    assert stats.late == 2
+    assert stats.min_saved_seconds == -0.5
+    assert stats.max_saved_seconds == -0.2
+
+
+def test_trace_replay(tmp_path):
+    """Verify a trace replays with the same decisions and survives truncation."""
+    background = _read_wav("etc/noise.wav")
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav") + background
+
+    trace_path = tmp_path / "test.trace"
+    recorder = WebRtcVadRecorder(
+        silence_method=SilenceMethod.VAD_AND_RATIO, max_current_ratio_threshold=20
+    )
+    with TraceWriter(trace_path) as trace:
+        recorder.trace = trace
+        command = _get_command(recorder, audio_data)
+        recorder.stop()
+
+    assert command
+
+    stats = replay_trace(trace_path)
+    assert stats.frames > 0
+    assert stats.commands == 1
+    assert stats.mismatches == 0
+    assert stats.energy_mismatches == 0
+    assert len(stats.replay_ns) == len(stats.traced_ns) == stats.frames
+
+    with TraceReader(trace_path) as reader:
+        records = []
+        traced_audio = bytes()
+        for record in reader:
+            records.append(record)
+            if record.frame is not None:
+                traced_audio += record.frame
+
+        assert records[0].config == recorder.config
+        assert [r.type for r in records].count(TraceRecordType.FRAME) == stats.frames
+        assert audio_data.startswith(traced_audio)
+
+        # Frames are released when the next record is read
+        frame = next(r.frame for r in records if r.frame is not None)
+        with pytest.raises(ValueError):
+            bytes(frame)
+
+    # Reader can be closed in the middle of iterating
+    with TraceReader(trace_path) as reader:
+        records_iter = iter(reader)
+        for record in records_iter:
+            if record.frame is not None:
+                break
+
+    assert record.frame is not None
+    with pytest.raises(ValueError):
+        bytes(record.frame)
+
+    # Last frame cut short (e.g., crash)
+    trace_bytes = trace_path.read_bytes()
+    trace_path.write_bytes(trace_bytes[:-100])
+    assert replay_trace(trace_path).frames == stats.frames - 1
+
+
+def test_trace_replay_energy(tmp_path, monkeypatch):
+    """Verify replay re-computes energy instead of using the traced value."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    trace_path = tmp_path / "test.trace"
+    recorder = WebRtcVadRecorder()
+    with TraceWriter(trace_path, energy=True) as trace:
+        recorder.trace = trace
+        _get_command(recorder, audio_data)
+        recorder.stop()
+
+    assert replay_trace(trace_path).energy_mismatches == 0
+
+    # Energy is only traced for vad_only if the writer asks for it
+    untraced_path = tmp_path / "untraced.trace"
+    recorder = WebRtcVadRecorder()
+    with TraceWriter(untraced_path) as trace:
+        recorder.trace = trace
+        _get_command(recorder, audio_data)
+        recorder.stop()
+
+    with TraceReader(untraced_path) as reader:
+        assert all(record.energy is None for record in reader)
+
+    # Changed energy computation is caught
+    monkeypatch.setattr(
+        WebRtcVadRecorder, "get_debiased_energy", staticmethod(lambda chunk: 1.0)
+    )
+    stats = replay_trace(trace_path)
+    assert stats.energy_mismatches > 0
+
+
+def test_trace_replay_sessions(tmp_path):
+    """Verify real-time replay paces every session appended to a trace."""
+    trace_path = tmp_path / "test.trace"
+    config = RecorderConfig()
+    frame = bytes(config.chunk_size)
+    delay_ns = 100_000_000
+
+    for _ in range(2):
+        with TraceWriter(trace_path) as trace:
+            trace.write_config(config)
+            trace.write_start()
+            trace.write_frame(
+                frame,
+                flags=0,
+                energy=None,
+                start_ns=time.perf_counter_ns() + delay_ns,
+                duration_ns=0,
+            )
+            trace.write_stop()
+
+    start_ns = time.perf_counter_ns()
+    stats = replay_trace(trace_path, real_time=True)
+    assert stats.frames == 2
+    assert (time.perf_counter_ns() - start_ns) >= 2 * delay_ns
+
+
+def test_read_audio_file():
+    """Verify WAV files are decoded to 16-bit mono audio."""
+    audio_data = _read_wav("etc/noise.wav")
+
+    sample_rate, blocks = read_audio_file(Path("etc/noise.wav"))
+    assert sample_rate == 16000
+    assert b"".join(bytes(block) for block in blocks) == audio_data
+
+
+def _write_wav(
+    wav_path: Path,
+    audio_data: bytes,
+    sample_rate: int,
+    sample_width: int,
+    channels: int,
+):
+    """Write PCM audio to a WAV file."""
+    wav_file: wave.Wave_write = wave.open(str(wav_path), "wb")
+    with wav_file:
+        wav_file.setframerate(sample_rate)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setnchannels(channels)
+        wav_file.writeframes(audio_data)
+
+
+def _read_converted(wav_path: Path) -> typing.Tuple[int, bytes]:
+    """Read WAV file with read_audio_file and join converted blocks."""
+    sample_rate, blocks = read_audio_file(wav_path)
+    return sample_rate, b"".join(bytes(block) for block in blocks)
+
+
+def test_read_audio_file_8bit(tmp_path):
+    """Verify unsigned 8-bit WAV audio is converted to signed 16-bit."""
+    audio_data = _read_wav("etc/noise.wav")
+
+    # WAV stores 8-bit audio unsigned
+    audio_8bit = audioop.lin2lin(audio_data, 2, 1)
+    wav_path = tmp_path / "8bit.wav"
+    _write_wav(wav_path, audioop.bias(audio_8bit, 1, 128), 16000, 1, 1)
+
+    sample_rate, converted = _read_converted(wav_path)
+    assert sample_rate == 16000
+    assert len(converted) == len(audio_data)
+    assert converted == audioop.lin2lin(audio_8bit, 1, 2)
+
+
+def test_read_audio_file_stereo(tmp_path):
+    """Verify stereo WAV audio is mixed down to mono."""
+    audio_data = _read_wav("etc/noise.wav")
+
+    wav_path = tmp_path / "stereo.wav"
+    _write_wav(wav_path, audioop.tostereo(audio_data, 2, 1, 1), 16000, 2, 2)
+
+    sample_rate, converted = _read_converted(wav_path)
+    assert sample_rate == 16000
+    assert converted == audio_data
+
+
+def test_read_audio_file_resample(tmp_path):
+    """Verify WAV audio at a rate webrtcvad does not support is resampled."""
+    audio_data = _read_wav("etc/noise.wav")
+
+    audio_44k, _ = audioop.ratecv(audio_data, 2, 1, 16000, 44100, None)
+    wav_path = tmp_path / "44k.wav"
+    _write_wav(wav_path, audio_44k, 44100, 2, 1)
+
+    sample_rate, converted = _read_converted(wav_path)
+    assert sample_rate == 16000
+    assert (len(converted) % 2) == 0
+
+    # Within a few samples of the original length
+    assert abs(len(converted) - len(audio_data)) <= 2 * 4
+
+
+def test_energy_trackers():
+    """Verify windowed max and quantile energy trackers."""
+    energies = [5, 1, 100, 3, 2, 50, 4, 4, 1, 7, 6, 200, 9, 8]
+
+    window_max = WindowMaxEnergy(window_frames=3)
+    running_max = WindowMaxEnergy()
+    quantile = WindowQuantileEnergy(quantile=0.5, window_frames=5)
+    for i, energy in enumerate(energies):
+        window = energies[max(0, i - 2) : i + 1]
+        assert window_max.add(energy) == max(window)
+        assert running_max.add(energy) == max(energies[: i + 1])
+
+        window = sorted(energies[max(0, i - 4) : i + 1])
+        expected = window[int(0.5 * (len(window) - 1))]
+        assert abs(quantile.add(energy) - expected) <= ((0.05 * expected) + 1e-6)
+
+
+def _double(value):
+    return 2 * value
+
+
+def _fail(value):
+    raise ValueError(value)
+
+
+def _exit(value):
+    raise SystemExit(value)
+
+
+def test_pipeline():
+    """Verify pipeline stages run inline, on threads, and in processes."""
+    for mode in StageMode:
+        pipeline = Pipeline(
+            [
+                MapStage(_double, name="first", mode=mode, queue_size=2),
+                MapStage(_double, name="second", mode=mode, queue_size=2),
+            ]
+        )
+        assert list(pipeline.run(range(100))) == [4 * i for i in range(100)]
+        assert pipeline.stats["first"].items_in == 100
+        assert pipeline.stats["second"].items_out == 100
+        assert pipeline.stats["second"].max_queue_depth <= 2
+
+        # Errors are raised in the consumer
+        pipeline = Pipeline([MapStage(_fail, mode=mode)])
+        with pytest.raises(ValueError):
+            list(pipeline.run(range(10)))
+
+    # Consumer does not wait forever if a thread stage exits
+    pipeline = Pipeline([MapStage(_exit, mode=StageMode.THREAD)])
+    with pytest.raises(SystemExit):
+        list(pipeline.run(range(10)))
+
+
+def test_pipeline_split():
+    """Verify recorder and trim stages match trimming recorded audio."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+    noise_data = _read_wav("etc/noise.wav")
+
+    audio_data = (audio_data + noise_data) * 2
+    chunks = (
+        audio_data[offset : offset + CHUNK_SIZE]
+        for offset in range(0, len(audio_data), CHUNK_SIZE)
+    )
+
+    pipeline = Pipeline(
+        [
+            RecorderStage(WebRtcVadRecorder(keep_frame_stats=True)),
+            TrimStage(mode=StageMode.THREAD),
+        ]
+    )
+    commands = list(pipeline.run(chunks))
+    assert len(commands) == 2
+    for command in commands:
+        assert command.audio_data
+        assert command.audio_data in audio_data
+
+
+def test_pipeline_offsets():
+    """Verify voice commands without audio pass through the trim stage."""
+    audio_data = _read_wav("etc/turn_on_living_room_lamp.wav")
+    noise_data = _read_wav("etc/noise.wav")
+
+    audio_data = (audio_data + noise_data) * 2
+    chunks = [
+        audio_data[offset : offset + CHUNK_SIZE]
+        for offset in range(0, len(audio_data), CHUNK_SIZE)
+    ]
+
+    def get_segments(keep_audio: bool, keep_frame_stats: bool):
+        recorder = WebRtcVadRecorder(
+            keep_audio=keep_audio, keep_frame_stats=keep_frame_stats
+        )
+        pipeline = Pipeline([RecorderStage(recorder), TrimStage()])
+        commands = list(pipeline.run(chunks))
+        assert len(commands) == 2
+        for command in commands:
+            assert (command.audio_data is not None) == keep_audio
+
+        return [command.segment for command in commands]
+
+    # Segment is only trimmed with frame statistics
+    untrimmed = get_segments(keep_audio=False, keep_frame_stats=False)
+    trimmed = get_segments(keep_audio=False, keep_frame_stats=True)
+    assert trimmed == get_segments(keep_audio=True, keep_frame_stats=True)
+    assert trimmed != untrimmed
@@ -0,0 +1,89 @@
+"""Soak test for long-running recorder sessions.
+
+Set RHASSPYSILENCE_SOAK_HOURS to simulate more audio (e.g., 72 for 3 days).
+"""
+import os
+import resource
+import sys
+import time
+import wave
+
+from rhasspysilence import PhraseOverflowPolicy, SilenceMethod, WebRtcVadRecorder
+
+SOAK_HOURS = float(os.environ.get("RHASSPYSILENCE_SOAK_HOURS", "0.25"))
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+# Allowed growth of peak RSS after warm-up
+MAX_RSS_GROWTH = 8 * 1024 * 1024
+
+# Allowed slowdown of per-frame cost from first to last quarter
+MAX_SLOWDOWN = 2.0
+
+
+def _get_max_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss
+
+    # Kilobytes on Linux
+    return max_rss * 1024
+
+
+def _read_wav(wav_path: str) -> bytes:
+    with wave.open(wav_path, "r") as wav_file:
+        return wav_file.readframes(wav_file.getnframes())
+
+
+def test_soak():
+    """Verify flat memory and stable per-frame cost over hours of audio."""
+    noise = _read_wav("etc/noise.wav")
+    command = _read_wav("etc/turn_on_living_room_lamp.wav")
+
+    # Noise, a short command, then a long stretch of back-to-back commands that
+    # would grow an unbounded phrase buffer.
+    cycle = noise + command + noise + (command * 20) + noise
+    cycle_seconds = len(cycle) / BYTES_PER_SECOND
+    num_cycles = max(4, int((SOAK_HOURS * 60 * 60) / cycle_seconds))
+
+    recorder = WebRtcVadRecorder(
+        max_seconds=None,
+        silence_method=SilenceMethod.VAD_AND_RATIO,
+        max_current_ratio_threshold=20,
+        keep_frame_stats=True,
+        max_events=64,
+        max_phrase_bytes=10 * BYTES_PER_SECOND,
+        phrase_overflow=PhraseOverflowPolicy.TRUNCATE,
+        reset_max_energy=True,
+    )
+    recorder.start()
+
+    chunk_size = 4096
+    quarter_times = [0.0] * 4
+    quarter_frames = [0] * 4
+    rss_after_warmup = 0
+
+    for cycle_index in range(num_cycles):
+        quarter = (4 * cycle_index) // num_cycles
+        start_time = time.perf_counter()
+        for offset in range(0, len(cycle), chunk_size):
+            if recorder.process_chunk(cycle[offset : offset + chunk_size]):
+                # Events are intentionally never cleared by the caller
+                recorder.stop()
+                recorder.start()
+
+        quarter_times[quarter] += time.perf_counter() - start_time
+        quarter_frames[quarter] += len(cycle) // recorder.chunk_size
+
+        assert len(recorder.events) <= 64
+        assert len(recorder.phrase_buffer or bytes()) <= 10 * BYTES_PER_SECOND
+
+        if cycle_index == (num_cycles // 4):
+            rss_after_warmup = _get_max_rss()
+
+    assert (_get_max_rss() - rss_after_warmup) <= MAX_RSS_GROWTH
+
+    first_cost = quarter_times[0] / quarter_frames[0]
+    last_cost = quarter_times[-1] / quarter_frames[-1]
+    assert last_cost <= (MAX_SLOWDOWN * first_cost)